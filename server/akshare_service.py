@@ -4,41 +4,150 @@ Akshare 微服务：为 Node 后端提供实时行情与主表兜底接口
 启动：python akshare_service.py --port 5001
 接口：
 - GET /quotes?symbols=000001,600000 返回实时价等基础字段
+- GET /quotes/sources 返回各行情源健康度与 p95 延迟
+- GET /history?symbol=600000&days=20&adjust=qfq 返回日线（带缓存），/history/cache 返回缓存命中统计
 - GET /master 返回全部 A 股代码/名称（价格仅参考）
+- GET /risk?symbols=000001,600000&window=60&benchmark=sh000300&alpha=0.95&weights=&cov=0 基于本地 K 线的风险指标
+  （指数基准需带 sh/sz 前缀并先用 eastmoney.sync_index_kline 同步，无数据时 beta 以等权组合为基准）
+/quotes、/history、/master 支持 ?format=rows|columns|msgpack 与 gzip/br 压缩，见 wire_format.py
+多进程部署时可设置 QUOTE_BOOK_NAME，/quotes 改为读取 quote_book.py 刷新进程维护的共享内存行情簿，
+否则经 quote_router.py 在东财直连与 akshare 之间对冲请求、自动切换
 """
 
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
 from flask import Flask, jsonify, request
 import akshare as ak
+import pandas as pd
+
+from history_cache import DEFAULT_MAX_BYTES, HistoryCache
+from wire_format import respond, rows_to_columns
 
 app = Flask(__name__)
 
+# /history 日线缓存：LRU + 收盘过期 + 并发请求合并，容量可通过 HISTORY_CACHE_BYTES 调整
+_history_cache = HistoryCache(
+  lambda symbol, adjust: ak.stock_zh_a_hist(symbol=symbol, period="daily", adjust=adjust),
+  max_bytes=int(os.getenv("HISTORY_CACHE_BYTES", DEFAULT_MAX_BYTES)),
+)
+
+# 共享内存行情簿（可选），未配置、挂载失败或刷新进程失联时回退到多源路由
+_quote_book = None
+
+
+def _get_quote_book():
+  global _quote_book
+  name = os.getenv("QUOTE_BOOK_NAME")
+  if not name:
+    return None
+  book = _quote_book
+  if book is not None and not book.is_stale():
+    return book
+  # 首次使用，或刷新进程已重启/退出：按名称重新挂载，新段代号不同
+  try:
+    from quote_book import QuoteBook
+    fresh = QuoteBook.attach(name)
+  except (FileNotFoundError, ValueError):
+    _quote_book = None
+    return None
+  # 旧映射不主动 close，可能仍有请求线程在读，引用释放后自动回收
+  _quote_book = fresh
+  if fresh.is_stale():
+    return None
+  if book is not None and fresh.generation != book.generation:
+    app.logger.info("行情簿已重新挂载，generation=%s", fresh.generation)
+  return fresh
+
+
+# 多源行情路由（东财直连 + akshare），首次请求时创建
+_quote_router = None
+
+
+def _get_quote_router():
+  global _quote_router
+  if _quote_router is None:
+    from quote_router import default_router
+    _quote_router = default_router()
+  return _quote_router
+
 
 def _ok(data):
   return jsonify({"success": True, "data": data})
 
 
+def _float_col(df, col):
+  """按列转换为 float 列表，列不存在时填 0，无法解析的值（停牌等）输出为 null。"""
+  if col not in df.columns:
+    return [0] * len(df)
+  values = pd.to_numeric(df[col], errors="coerce").astype(float)
+  return values.astype(object).where(values.notna(), None).tolist()
+
+
+def _date_col(df, col):
+  """日期列统一输出为 YYYY-MM-DD 字符串（akshare 可能返回 datetime.date 或字符串），各响应格式保持一致。"""
+  dates = pd.to_datetime(df[col], errors="coerce")
+  return dates.dt.strftime("%Y-%m-%d").astype(object).where(dates.notna(), None).tolist()
+
+
+QUOTE_KEYS = ("symbol", "name", "price", "prevClose", "high", "low", "open", "volume", "amount")
+HISTORY_COLUMNS = (
+  ("open", "开盘"),
+  ("close", "收盘"),
+  ("high", "最高"),
+  ("low", "最低"),
+  ("volume", "成交量"),
+  ("amount", "成交额"),
+  ("amplitude", "振幅"),
+  ("change_pct", "涨跌幅"),
+  ("change_amt", "涨跌额"),
+  ("turnover", "换手率"),
+)
+
+
+def _quote_row(q):
+  """将东财字段名的统一行情转换为 Node 端使用的 /quotes 输出格式。"""
+  row = {
+    "symbol": q["code"],
+    "name": q["name"],
+    "price": q["last"],
+    "prevClose": q["pre_close"],
+    "high": q["high"],
+    "low": q["low"],
+    "open": q["open"],
+    "volume": q["volume"],
+    "amount": q["amount"],
+  }
+  if "source" in q:
+    row["source"] = q["source"]
+  return row
+
+
 @app.route("/quotes")
 def quotes():
   symbols_str = request.args.get("symbols", "")
   if not symbols_str:
     return jsonify({"success": False, "error": "symbols required"}), 400
   symbols = [s.strip() for s in symbols_str.split(",") if s.strip()]
-  df = ak.stock_zh_a_spot_em()
-  df = df[df["代码"].isin(symbols)]
-  data = []
-  for _, row in df.iterrows():
-    data.append({
-      "symbol": row["代码"],
-      "name": row["名称"],
-      "price": float(row["最新价"]) if "最新价" in row else 0,
-      "prevClose": float(row["昨收"]) if "昨收" in row else 0,
-      "high": float(row["最高"]) if "最高" in row else 0,
-      "low": float(row["最低"]) if "最低" in row else 0,
-      "open": float(row["今开"]) if "今开" in row else 0,
-      "volume": float(row["成交量"]) if "成交量" in row else 0,
-      "amount": float(row["成交额"]) if "成交额" in row else 0,
-    })
-  return _ok(data)
+  book = _get_quote_book()
+  if book is not None and book.updated_ms:
+    try:
+      return respond(rows_to_columns([_quote_row(q) for q in book.get_many(symbols)], QUOTE_KEYS))
+    except TimeoutError as e:
+      # 写入方卡在写入中（被抢占或异常），本次改走多源路由
+      app.logger.warning("行情簿读取超时，回退到多源路由：%s", e)
+  try:
+    rows = _get_quote_router().get_quotes(symbols)
+  except RuntimeError as e:
+    return jsonify({"success": False, "error": str(e)}), 502
+  return respond(rows_to_columns([_quote_row(q) for q in rows], QUOTE_KEYS + ("source",)))
+
+
+@app.route("/quotes/sources")
+def quote_sources():
+  return _ok(_get_quote_router().stats())
 
 
 @app.route("/history")
@@ -53,53 +162,96 @@ def history():
       days = int(days)
   except:
       days = 20
+  adjust = request.args.get("adjust", "qfq")
+  if adjust not in ("qfq", "hfq", ""):
+    return jsonify({"success": False, "error": "adjust must be qfq, hfq or empty"}), 400
       
-  # Akshare requires specific date range or it returns all. 
-  # For simplicity, we fetch all (default) or use start_date if needed, 
-  # but stock_zh_a_hist is fast enough for recent data usually.
-  # Adjust symbol format: 600000 -> 600000
+  # Akshare returns full history without a date range; the full frame is cached
+  # per (symbol, adjust) until the next close and the last N rows are sliced here.
   try:
-    df = ak.stock_zh_a_hist(symbol=symbol, period="daily", adjust="qfq")
+    df = _history_cache.get(symbol, adjust)
     if df.empty:
-       return jsonify({"success": True, "data": []})
-    
+      return respond({"date": [], **{key: [] for key, _ in HISTORY_COLUMNS}})
+
     # Take last N
     df = df.tail(days)
-    
-    data = []
-    for _, row in df.iterrows():
-      data.append({
-        "date": row["日期"],
-        "open": float(row["开盘"]),
-        "close": float(row["收盘"]),
-        "high": float(row["最高"]),
-        "low": float(row["最低"]),
-        "volume": float(row["成交量"]),
-        "amount": float(row["成交额"]),
-        "amplitude": float(row["振幅"]),
-        "change_pct": float(row["涨跌幅"]),
-        "change_amt": float(row["涨跌额"]),
-        "turnover": float(row["换手率"])
-      })
-    return _ok(data)
+    columns = {"date": _date_col(df, "日期")}
+    for key, col in HISTORY_COLUMNS:
+      columns[key] = _float_col(df, col)
+    return respond(columns)
   except Exception as e:
     return jsonify({"success": False, "error": str(e)}), 500
 
 
+@app.route("/history/cache")
+def history_cache_stats():
+  return _ok(_history_cache.stats())
+
+
+# 风险引擎按 (股票池, 窗口, 基准) LRU 缓存，每次请求只增量推入新 K 线；个数上限可通过 RISK_ENGINE_CACHE_SIZE 调整
+RISK_ENGINE_CACHE_SIZE = int(os.getenv("RISK_ENGINE_CACHE_SIZE", "32"))
+_risk_engines = OrderedDict()
+# 只保护缓存字典本身；引擎装载与刷新持有各自键的锁，不同股票池的请求互不阻塞
+_risk_lock = threading.Lock()
+
+
+class _RiskEntry:
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.engine = None
+
+
+@app.route("/risk")
+def risk():
+  from risk_engine import DEFAULT_ALPHA, DEFAULT_WINDOW, RiskEngine
+  symbols = [s.strip() for s in request.args.get("symbols", "").split(",") if s.strip()]
+  if not symbols:
+    return jsonify({"success": False, "error": "symbols required"}), 400
+  try:
+    window = int(request.args.get("window", DEFAULT_WINDOW))
+    alpha = float(request.args.get("alpha", DEFAULT_ALPHA))
+    weights_str = request.args.get("weights", "")
+    weights = [float(w) for w in weights_str.split(",")] if weights_str else None
+  except ValueError:
+    return jsonify({"success": False, "error": "invalid window/alpha/weights"}), 400
+  if weights is not None and len(weights) != len(symbols):
+    return jsonify({"success": False, "error": "weights must match symbols"}), 400
+  benchmark = request.args.get("benchmark") or None
+  key = (tuple(symbols), window, benchmark)
+  with _risk_lock:
+    entry = _risk_engines.get(key)
+    if entry is None:
+      entry = _risk_engines[key] = _RiskEntry()
+      while len(_risk_engines) > RISK_ENGINE_CACHE_SIZE:
+        _risk_engines.popitem(last=False)
+    else:
+      _risk_engines.move_to_end(key)
+  try:
+    with entry.lock:
+      if entry.engine is None:
+        entry.engine = RiskEngine.from_db(symbols, window, benchmark)
+      else:
+        entry.engine.refresh()
+      return _ok(entry.engine.summary(weights, alpha, with_cov=request.args.get("cov") == "1"))
+  except ValueError as e:
+    return jsonify({"success": False, "error": str(e)}), 422
+  except sqlite3.Error as e:
+    # 本地库不可用（如尚未同步 K 线、表不存在）
+    return jsonify({"success": False, "error": f"kline database unavailable: {e}"}), 503
+
+
 @app.route("/master")
 def master():
   df = ak.stock_zh_a_spot_em()
-  data = []
-  for _, row in df.iterrows():
-    data.append({
-      "symbol": row["代码"],
-      "name": row["名称"],
-      "price": float(row["最新价"]) if "最新价" in row else 0,
-      "change": float(row["涨跌幅"]) if "涨跌幅" in row else 0,
-      "volume": float(row["成交量"]) if "成交量" in row else 0,
-      "market_id": 1 if str(row["代码"]).startswith("6") else 0,
-    })
-  return _ok(data)
+  codes = df["代码"].astype(str)
+  return respond({
+    "symbol": df["代码"].tolist(),
+    "name": df["名称"].tolist(),
+    "price": _float_col(df, "最新价"),
+    "change": _float_col(df, "涨跌幅"),
+    "volume": _float_col(df, "成交量"),
+    "market_id": codes.str.startswith("6").astype(int).tolist(),
+  })
 
 
 if __name__ == "__main__":
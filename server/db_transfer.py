@@ -0,0 +1,314 @@
+"""
+SQLite 行情库流式导出/导入工具（a_stock_master、a_stock_kline_daily、a_stock_adj_factor）。
+
+用法：
+  python db_transfer.py export --db stock.db --out market.atx.gz
+  python db_transfer.py import --db server/database.sqlite --in market.atx.gz
+  python db_transfer.py verify --in market.atx.gz
+
+文件格式（gzip 压缩的行分帧流）：
+- 第 1 行：清单 JSON，含格式版本、分块行数以及源库各表的建表/建索引语句
+- 每个分块：一行头部 JSON {table, columns, rows, bytes, sha256}，随后是 bytes 字节的 JSON 行数组与换行
+- 最后一行：{"end": true, "tables": {表名: {rows, sha256}}}，sha256 为该表各分块摘要的链式摘要
+
+导出与导入都按固定行数分块处理，内存占用与总数据量无关。导入前先完整流式校验一遍文件，
+校验失败时目标库不做任何写入；随后每个分块一个事务批量写入。目标表为空时先删除其索引，
+全部写入后按目标原有索引与源索引的并集重建，非空时保留索引并按主键/唯一索引覆盖写入。
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import hashlib
+import json
+import re
+import sqlite3
+import time
+from typing import Dict, IO, Iterator, List, Optional, Sequence, Tuple
+
+from eastmoney import _log
+
+FORMAT_NAME = "alphatrader-db-export"
+FORMAT_VERSION = 1
+DEFAULT_TABLES = ("a_stock_master", "a_stock_kline_daily", "a_stock_adj_factor")
+DEFAULT_CHUNK_ROWS = 50000
+# 自增主键不导出，导入时由目标库重新分配
+EXCLUDED_COLUMNS = {"a_stock_kline_daily": {"id"}}
+# 导入只接受单条建表/建索引语句，标识符允许用双引号、反引号或方括号包裹
+_IDENT = r"[\"`\[]?(\w+)[\"`\]]?"
+_CREATE_TABLE_RE = re.compile(rf"\s*CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?{_IDENT}\s*\(", re.I)
+_CREATE_INDEX_RE = re.compile(
+    rf"\s*CREATE\s+(?:UNIQUE\s+)?INDEX\s+(?:IF\s+NOT\s+EXISTS\s+)?{_IDENT}\s+ON\s+{_IDENT}\s*\(", re.I
+)
+
+
+def _table_schema(conn: sqlite3.Connection, table: str) -> Optional[Dict]:
+    """读取表的建表语句、索引语句与导出列，表不存在时返回 None。"""
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?;", (table,)).fetchone()
+    if row is None:
+        return None
+    indexes = [
+        r[0]
+        for r in conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type='index' AND tbl_name=? AND sql IS NOT NULL ORDER BY name;",
+            (table,),
+        )
+    ]
+    excluded = EXCLUDED_COLUMNS.get(table, set())
+    columns = [r[1] for r in conn.execute(f"PRAGMA table_info({table});") if r[1] not in excluded]
+    return {"name": table, "sql": row[0], "indexes": indexes, "columns": columns}
+
+
+def _write_frame(out: IO[bytes], header: Dict, payload: bytes) -> None:
+    out.write(json.dumps(header, ensure_ascii=False).encode("utf-8") + b"\n")
+    out.write(payload + b"\n")
+
+
+def export_db(
+    db_path: str,
+    out_path: str,
+    tables: Sequence[str] = DEFAULT_TABLES,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+) -> Dict[str, int]:
+    """分块导出指定表，返回各表行数；源库中不存在的表跳过。"""
+    conn = sqlite3.connect(db_path)
+    try:
+        schemas = [s for s in (_table_schema(conn, t) for t in tables) if s is not None]
+        manifest = {
+            "format": FORMAT_NAME,
+            "version": FORMAT_VERSION,
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "chunk_rows": chunk_rows,
+            "tables": schemas,
+        }
+        totals: Dict[str, Dict] = {}
+        with gzip.open(out_path, "wb", compresslevel=6) as out:
+            out.write(json.dumps(manifest, ensure_ascii=False).encode("utf-8") + b"\n")
+            for schema in schemas:
+                table, columns = schema["name"], schema["columns"]
+                chain = hashlib.sha256()
+                count = 0
+                cursor = conn.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY rowid;")
+                while True:
+                    rows = cursor.fetchmany(chunk_rows)
+                    if not rows:
+                        break
+                    payload = json.dumps(rows, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+                    digest = hashlib.sha256(payload).hexdigest()
+                    _write_frame(
+                        out,
+                        {"table": table, "columns": columns, "rows": len(rows), "bytes": len(payload), "sha256": digest},
+                        payload,
+                    )
+                    chain.update(digest.encode("ascii"))
+                    count += len(rows)
+                totals[table] = {"rows": count, "sha256": chain.hexdigest()}
+                _log(f"{table} 导出 {count} 行")
+            out.write(json.dumps({"end": True, "tables": totals}).encode("utf-8") + b"\n")
+    finally:
+        conn.close()
+    return {t: v["rows"] for t, v in totals.items()}
+
+
+def _single_statement(sql: str) -> bool:
+    """语句中除末尾分号外不得再有分号，避免一条 DDL 夹带其他语句。"""
+    return ";" not in sql.rstrip().rstrip(";")
+
+
+def _validate_manifest(manifest: Dict) -> None:
+    """
+    校验清单中的表结构：只接受 DEFAULT_TABLES 中的表，建表语句必须是 CREATE TABLE <该表>，
+    索引语句必须是 CREATE [UNIQUE] INDEX ... ON <该表>，列名必须是普通标识符。不符合时抛出 ValueError。
+    """
+    seen = set()
+    for schema in manifest.get("tables", []):
+        table = schema.get("name")
+        if table not in DEFAULT_TABLES or table in seen:
+            raise ValueError(f"不支持导入的表：{table}")
+        seen.add(table)
+        sql = schema.get("sql", "")
+        match = _CREATE_TABLE_RE.match(sql)
+        if not match or match.group(1) != table or not _single_statement(sql):
+            raise ValueError(f"{table} 建表语句不合法")
+        for index_sql in schema.get("indexes", []):
+            match = _CREATE_INDEX_RE.match(index_sql)
+            if not match or match.group(2) != table or not _single_statement(index_sql):
+                raise ValueError(f"{table} 建索引语句不合法")
+        if not all(isinstance(c, str) and c.isidentifier() for c in schema.get("columns", [])):
+            raise ValueError(f"{table} 列名不合法")
+
+
+def _read_frames(path: str) -> Iterator[Tuple[str, Dict, Optional[List]]]:
+    """
+    逐帧读取导出文件并校验，依次产出 ("manifest", 清单, None)、("chunk", 头部, 行)、("end", 尾部, None)。
+    清单表结构不合法、分块的表或列不在清单中、分块摘要或表级链式摘要不一致时抛出 ValueError。
+    """
+    with gzip.open(path, "rb") as fp:
+        manifest = json.loads(fp.readline())
+        if manifest.get("format") != FORMAT_NAME or manifest.get("version") != FORMAT_VERSION:
+            raise ValueError(f"不支持的导出文件格式：{manifest.get('format')} v{manifest.get('version')}")
+        _validate_manifest(manifest)
+        columns_by_table = {t["name"]: set(t["columns"]) for t in manifest["tables"]}
+        yield "manifest", manifest, None
+        chains: Dict[str, "hashlib._Hash"] = {}
+        counts: Dict[str, int] = {}
+        while True:
+            line = fp.readline()
+            if not line:
+                raise ValueError("导出文件不完整：缺少结束标记")
+            header = json.loads(line)
+            if header.get("end"):
+                for table, expected in header["tables"].items():
+                    chain = chains.get(table, hashlib.sha256())
+                    if counts.get(table, 0) != expected["rows"] or chain.hexdigest() != expected["sha256"]:
+                        raise ValueError(f"{table} 表级校验失败")
+                yield "end", header, None
+                return
+            table = header.get("table")
+            if table not in columns_by_table or not set(header.get("columns", [])) <= columns_by_table[table]:
+                raise ValueError(f"{table} 分块的表或列不在清单中")
+            payload = fp.read(header["bytes"])
+            fp.read(1)  # 分块后的换行
+            digest = hashlib.sha256(payload).hexdigest()
+            if len(payload) != header["bytes"] or digest != header["sha256"]:
+                raise ValueError(f"{header['table']} 分块校验失败")
+            rows = json.loads(payload)
+            if len(rows) != header["rows"]:
+                raise ValueError(f"{header['table']} 分块行数不符")
+            chains.setdefault(table, hashlib.sha256()).update(digest.encode("ascii"))
+            counts[table] = counts.get(table, 0) + len(rows)
+            yield "chunk", header, rows
+
+
+def verify_export(path: str) -> Dict[str, int]:
+    """只校验不导入，返回各表行数。"""
+    totals: Dict[str, int] = {}
+    for kind, header, _ in _read_frames(path):
+        if kind == "end":
+            totals = {t: v["rows"] for t, v in header["tables"].items()}
+    return totals
+
+
+def _if_not_exists(sql: str, kind: str) -> str:
+    """为建表/建索引语句补上 IF NOT EXISTS。"""
+    if "IF NOT EXISTS" in sql.upper():
+        return sql
+    for prefix in (f"CREATE UNIQUE {kind} ", f"CREATE {kind} "):
+        if sql.upper().startswith(prefix):
+            return prefix + "IF NOT EXISTS " + sql[len(prefix):]
+    return sql
+
+
+def _index_name(sql: str) -> str:
+    """从 CREATE [UNIQUE] INDEX [IF NOT EXISTS] name ON ... 语句中取出索引名。"""
+    match = _CREATE_INDEX_RE.match(sql)
+    return match.group(1) if match else sql
+
+
+def _check_columns(conn: sqlite3.Connection, schema: Dict, must_exist: bool) -> None:
+    """导入列必须都是目标表的列；目标表不存在且 must_exist=False 时跳过。"""
+    table = schema["name"]
+    target_columns = {r[1] for r in conn.execute(f"PRAGMA table_info({table});")}
+    if not target_columns and not must_exist:
+        return
+    missing = set(schema["columns"]) - target_columns
+    if missing:
+        raise ValueError(f"{table} 目标表缺少列：{', '.join(sorted(missing))}")
+
+
+def import_db(db_path: str, in_path: str) -> Dict[str, int]:
+    """流式导入导出文件，返回各表写入行数；文件校验不通过时抛出 ValueError 且不写入目标库。"""
+    # 先完整校验一遍（同样流式读取），截断或损坏的文件不会留下部分数据
+    verify_export(in_path)
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    # 仅本连接生效：批量导入时放宽同步、扩大页缓存
+    conn.execute("PRAGMA synchronous=OFF;")
+    conn.execute("PRAGMA cache_size=-65536;")
+    deferred: Dict[str, List[str]] = {}
+    written: Dict[str, int] = {}
+    try:
+        for kind, header, rows in _read_frames(in_path):
+            if kind == "manifest":
+                # 目标表已存在时结构可能不同：先检查全部表，再做任何建表/删索引
+                for schema in header["tables"]:
+                    _check_columns(conn, schema, must_exist=False)
+                for schema in header["tables"]:
+                    table = schema["name"]
+                    conn.execute(_if_not_exists(schema["sql"], "TABLE"))
+                    _check_columns(conn, schema, must_exist=True)
+                    existing = conn.execute(
+                        "SELECT name, sql FROM sqlite_master WHERE type='index' AND tbl_name=? AND sql IS NOT NULL;",
+                        (table,),
+                    ).fetchall()
+                    empty = conn.execute(f"SELECT 1 FROM {table} LIMIT 1;").fetchone() is None
+                    index_sql = [_if_not_exists(s, "INDEX") for s in schema["indexes"]]
+                    if empty:
+                        # 空表：先删索引，全部写入后重建目标原有索引与源索引的并集（同名以目标为准）
+                        rebuild = [_if_not_exists(sql, "INDEX") for _, sql in existing]
+                        names = {name.lower() for name, _ in existing}
+                        rebuild += [sql for sql in index_sql if _index_name(sql).lower() not in names]
+                        for name, _ in existing:
+                            conn.execute(f'DROP INDEX IF EXISTS "{name}";')
+                        deferred[table] = rebuild
+                    else:
+                        for sql in index_sql:
+                            conn.execute(sql)
+                    written[table] = 0
+            elif kind == "chunk":
+                table, columns = header["table"], header["columns"]
+                sql = (
+                    f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) "
+                    f"VALUES ({', '.join('?' * len(columns))});"
+                )
+                conn.execute("BEGIN;")
+                try:
+                    conn.executemany(sql, rows)
+                    conn.execute("COMMIT;")
+                except Exception:
+                    conn.execute("ROLLBACK;")
+                    raise
+                written[table] += len(rows)
+        for table in list(deferred):
+            for sql in deferred.pop(table):
+                conn.execute(sql)
+            _log(f"{table} 导入 {written[table]} 行，索引已重建")
+    finally:
+        # 校验失败时也补建已删除的索引，保证目标库结构完整
+        for index_sql in deferred.values():
+            for sql in index_sql:
+                try:
+                    conn.execute(sql)
+                except sqlite3.DatabaseError:
+                    pass
+        conn.close()
+    return written
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="SQLite 行情库流式导出/导入")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_export = sub.add_parser("export")
+    p_export.add_argument("--db", required=True)
+    p_export.add_argument("--out", required=True)
+    p_export.add_argument("--tables", default=",".join(DEFAULT_TABLES))
+    p_export.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    p_import = sub.add_parser("import")
+    p_import.add_argument("--db", required=True)
+    p_import.add_argument("--in", dest="in_path", required=True)
+    p_verify = sub.add_parser("verify")
+    p_verify.add_argument("--in", dest="in_path", required=True)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if args.command == "export":
+        totals = export_db(args.db, args.out, [t for t in args.tables.split(",") if t], args.chunk_rows)
+    elif args.command == "import":
+        totals = import_db(args.db, args.in_path)
+    else:
+        totals = verify_export(args.in_path)
+    _log(f"{args.command} 完成，用时 {time.perf_counter() - start:.1f}s：{totals}")
+
+
+if __name__ == "__main__":
+    main()
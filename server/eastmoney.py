@@ -2,6 +2,7 @@
 东方财富 A 股抓取与 SQLite 入库脚本。
 
 提供主表全量拉取、实时行情刷新、日线 K 线存储的功能函数。
+K 线以不复权价格入库，另存除权因子与东财复权仿射项，前/后复权在读取时换算得到。
 所有数据库操作仅使用 sqlite3 标准库，便于与现有 sidecar 共享。
 """
 
@@ -10,8 +11,9 @@ from __future__ import annotations
 import os
 import sqlite3
 from datetime import datetime, timedelta, timezone
-from typing import Dict, Iterable, List
+from typing import Dict, Iterable, List, Sequence
 
+import numpy as np
 import pandas as pd
 import requests
 
@@ -25,7 +27,17 @@ KLINE_URL = "https://push2his.eastmoney.com/api/qt/stock/kline/get"
 
 # 固定字段映射
 CLIST_FIELDS = "f12,f13,f14,f2,f3,f4,f5,f6,f15,f16,f17,f18,f20,f21,f9,f23"
-REALTIME_FIELDS = "f57,f58,f43,f60,f44,f45,f46,f47,f71,f168,f164"
+REALTIME_FIELDS = "f57,f58,f43,f60,f44,f45,f46,f47,f48,f71,f168,f164"
+# K 线字段：日期,开盘,收盘,最高,最低,成交量,成交额,振幅,涨跌幅,涨跌额,换手率
+KLINE_FIELDS1 = "f1,f2,f3,f4,f5,f6"
+KLINE_FIELDS2 = "f51,f52,f53,f54,f55,f56,f57,f58,f59,f60,f61"
+
+# 复权价格列，成交量/成交额不参与复权
+ADJUST_PRICE_COLUMNS = ("open", "close", "high", "low")
+# 指数代码前缀 -> 东财市场编号；指数日线以带前缀的代码（如 sh000300）存入 a_stock_kline_daily
+INDEX_MARKETS = {"sh": "1", "sz": "0"}
+# 增量同步遇到新除权时，回看的已存 K 线根数（用于拟合除权仿射项）
+ADJ_FIT_LOOKBACK = 20
 
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0 Safari/537.36",
@@ -37,8 +49,14 @@ SH_TZ = timezone(timedelta(hours=8))
 
 
 def code_to_secid(code: str) -> str:
-    """按规则将 6 位代码转换为 secid（6 开头为沪市 1，其余视为深市 0）。"""
+    """
+    按规则将代码转换为 secid：6 位股票代码 6 开头为沪市 1，其余视为深市 0；
+    带 sh/sz 前缀的指数代码（如 sh000300）按前缀取市场，避免与同号股票（000300/000001）混淆。
+    """
     code = code.strip()
+    prefix = code[:2].lower()
+    if prefix in INDEX_MARKETS:
+        return f"{INDEX_MARKETS[prefix]}.{code[2:]}"
     market_prefix = "1" if code.startswith("6") else "0"
     return f"{market_prefix}.{code}"
 
@@ -119,7 +137,7 @@ def fetch_a_stock_list() -> pd.DataFrame:
 
 
 def init_db() -> None:
-    """创建 a_stock_master 和 a_stock_kline_daily 表及索引（若不存在）。"""
+    """创建 a_stock_master、a_stock_kline_daily、a_stock_adj_factor 表及索引（若不存在）。"""
     conn = sqlite3.connect(DB_PATH)
     try:
         cursor = conn.cursor()
@@ -159,8 +177,24 @@ def init_db() -> None:
 
             CREATE UNIQUE INDEX IF NOT EXISTS idx_kline_code_date
             ON a_stock_kline_daily(code, date);
+
+            -- 后复权累计因子，仅在除权除息日记录变化点；
+            -- cash/ratio 为东财复权的仿射项 (P - cash) / (1 + ratio)，未知时为 NULL
+            CREATE TABLE IF NOT EXISTS a_stock_adj_factor (
+              code TEXT,
+              date TEXT,
+              factor REAL,
+              cash REAL,
+              ratio REAL,
+              PRIMARY KEY (code, date)
+            );
             """
         )
+        # 旧库的因子表缺少仿射项列，补齐
+        columns = {r[1] for r in cursor.execute("PRAGMA table_info(a_stock_adj_factor);")}
+        for column in ("cash", "ratio"):
+            if column not in columns:
+                cursor.execute(f"ALTER TABLE a_stock_adj_factor ADD COLUMN {column} REAL;")
         conn.commit()
     finally:
         conn.close()
@@ -212,8 +246,8 @@ def save_master_to_db(df: pd.DataFrame) -> None:
 
 def fetch_realtime_quote(code: str) -> Dict:
     """
-    获取单只股票实时行情并做字段映射，价格类字段除以 100 还原。
-    返回字典包含 code, name, last, pre_close, high, low, open, volume, avg_price,
+    获取单只股票实时行情并做字段映射；fltt=2 时接口直接返回以元为单位的小数，与 fetch_a_stock_list 一致。
+    返回字典包含 code, name, last, pre_close, high, low, open, volume, amount, avg_price,
     turnover_rate, volume_ratio。
     """
     params = {
@@ -227,19 +261,20 @@ def fetch_realtime_quote(code: str) -> Dict:
     resp.raise_for_status()
     data = resp.json().get("data") or {}
 
-    def _p(field: str, scale: float = 1.0) -> float:
-        return _safe_float(data.get(field)) / scale
+    def _p(field: str) -> float:
+        return _safe_float(data.get(field))
 
     return {
         "code": data.get("f57") or code,
         "name": data.get("f58") or "",
-        "last": _p("f43", 100),
-        "pre_close": _p("f60", 100),
-        "high": _p("f44", 100),
-        "low": _p("f45", 100),
-        "open": _p("f46", 100),
+        "last": _p("f43"),
+        "pre_close": _p("f60"),
+        "high": _p("f44"),
+        "low": _p("f45"),
+        "open": _p("f46"),
         "volume": _p("f47"),
-        "avg_price": _p("f71", 100),
+        "amount": _p("f48"),
+        "avg_price": _p("f71"),
         "turnover_rate": _p("f168"),
         "volume_ratio": _p("f164"),
     }
@@ -310,67 +345,323 @@ def refresh_realtime_quotes_in_db(codes: Iterable[str]) -> None:
         conn.close()
 
 
-def fetch_kline_history(code: str, beg: str = "0", end: str = "99999999") -> pd.DataFrame:
+def fetch_kline_history(
+    code: str, beg: str = "0", end: str = "99999999", fqt: str = "1"
+) -> pd.DataFrame:
     """
-    获取日线前复权数据，解析为 DataFrame（列：date, open, close, high, low, volume, amount）。
+    获取日线数据，解析为 DataFrame（列：date, open, close, high, low, volume, amount）。
+    fqt：0 不复权，1 前复权（默认），2 后复权。返回行含涨跌额时额外给出 pre_close 列。
     """
     params = {
         "secid": code_to_secid(code),
         "klt": "101",
-        "fqt": "1",
+        "fqt": fqt,
         "beg": beg,
         "end": end,
+        "fields1": KLINE_FIELDS1,
+        "fields2": KLINE_FIELDS2,
     }
     resp = requests.get(KLINE_URL, params=params, headers=HEADERS, timeout=10)
     resp.raise_for_status()
-    data = resp.json().get("data", {})
+    data = resp.json().get("data") or {}
     klines = data.get("klines") or []
     parsed = []
     for row in klines:
-        # 行格式：日期,开盘价,收盘价,最高价,最低价,成交量,成交额,...
+        # 行格式：日期,开盘价,收盘价,最高价,最低价,成交量,成交额,振幅,涨跌幅,涨跌额,换手率
         parts = row.split(",")
         if len(parts) < 7:
             continue
-        parsed.append(
-            {
-                "date": parts[0],
-                "open": _safe_float(parts[1]),
-                "close": _safe_float(parts[2]),
-                "high": _safe_float(parts[3]),
-                "low": _safe_float(parts[4]),
-                "volume": _safe_float(parts[5]),
-                "amount": _safe_float(parts[6]),
-            }
-        )
+        item = {
+            "date": parts[0],
+            "open": _safe_float(parts[1]),
+            "close": _safe_float(parts[2]),
+            "high": _safe_float(parts[3]),
+            "low": _safe_float(parts[4]),
+            "volume": _safe_float(parts[5]),
+            "amount": _safe_float(parts[6]),
+        }
+        if len(parts) >= 10:
+            # 交易所前收 = 收盘 - 涨跌额，除权日与上一日收盘不等
+            item["pre_close"] = round(item["close"] - _safe_float(parts[9]), 2)
+        parsed.append(item)
     return pd.DataFrame(parsed)
 
 
+def compute_adj_factors(
+    df_raw: pd.DataFrame, base_factor: float = 1.0, prev_close: float | None = None
+) -> pd.DataFrame:
+    """
+    由不复权日线计算后复权累计因子变化点（列：date, factor）。
+
+    除权日因子 = 上一因子 * 上日收盘 / 当日前收；无除权的交易日不产生记录。
+    prev_close 为窗口之前最后一根已存 K 线的收盘价，为空时窗口首日以 base_factor 作为起点记录
+    （行情缺少涨跌额、无法识别除权时也至少返回该起点）。
+    """
+    if df_raw.empty:
+        return pd.DataFrame(columns=["date", "factor"])
+    if "pre_close" not in df_raw.columns:
+        if prev_close is None:
+            return pd.DataFrame({"date": df_raw["date"].iloc[:1].to_numpy(), "factor": [base_factor]})
+        return pd.DataFrame(columns=["date", "factor"])
+    close = df_raw["close"].to_numpy(dtype=float)
+    pre_close = df_raw["pre_close"].to_numpy(dtype=float)
+    prev = np.empty_like(close)
+    prev[0] = prev_close if prev_close else np.nan
+    prev[1:] = close[:-1]
+    valid = (prev > 0) & (pre_close > 0) & (np.round(prev - pre_close, 2) != 0)
+    ratio = np.where(valid, prev / np.where(pre_close > 0, pre_close, 1.0), 1.0)
+    factors = base_factor * np.cumprod(ratio)
+    mark = valid.copy()
+    if prev_close is None:
+        mark[0] = True
+    return pd.DataFrame({"date": df_raw["date"].to_numpy()[mark], "factor": factors[mark]})
+
+
+def fit_adj_terms(df_raw: pd.DataFrame, df_qfq: pd.DataFrame, events: Sequence[str]) -> pd.DataFrame:
+    """
+    由同一区间的不复权与东财前复权（fqt=1）日线反推除权事件的仿射项（列：date, cash, ratio）。
+
+    东财前复权对每次除权按 (P - cash) / (1 + ratio) 逐次叠加，相邻两次除权之间的区段满足
+    qfq = a * P + b。按区段用 OHLC 做最小二乘得到 (a, b)，相邻区段之比即该次除权的仿射项；
+    最后一个区段是恒等变换。区段缺数据或价格无差异无法拟合时，对应事件不返回。
+    """
+    events = sorted(events)
+    if not events or df_raw.empty or df_qfq.empty:
+        return pd.DataFrame(columns=["date", "cash", "ratio"])
+    cols = list(ADJUST_PRICE_COLUMNS)
+    merged = df_raw[["date", *cols]].merge(df_qfq[["date", *cols]], on="date", suffixes=("", "_qfq"))
+    segment = np.searchsorted(np.asarray(events), merged["date"].to_numpy(), side="right")
+    x_all = merged[cols].to_numpy(dtype=float)
+    y_all = merged[[f"{c}_qfq" for c in cols]].to_numpy(dtype=float)
+
+    fits: Dict[int, tuple] = {len(events): (1.0, 0.0)}
+    for k in range(len(events)):
+        x, y = x_all[segment == k].ravel(), y_all[segment == k].ravel()
+        if len(x) >= 2 and np.ptp(x) > 0:
+            a, b = np.polyfit(x, y, 1)
+            if a > 0:
+                fits[k] = (float(a), float(b))
+
+    records = []
+    for k, date in enumerate(events):
+        if k not in fits or k + 1 not in fits:
+            continue
+        (a0, b0), (a1, b1) = fits[k], fits[k + 1]
+        # T = A_{k+1}^-1 ∘ A_k，T(P) = (P - cash) / (1 + ratio)
+        scale, shift = a0 / a1, (b0 - b1) / a1
+        records.append({"date": date, "cash": round(-shift / scale, 6), "ratio": round(1.0 / scale - 1.0, 6)})
+    return pd.DataFrame(records, columns=["date", "cash", "ratio"])
+
+
+def _upsert_adj_factors(cursor: sqlite3.Cursor, code: str, df_factor: pd.DataFrame) -> None:
+    def _opt(row, column: str):
+        value = row.get(column)
+        return None if value is None or pd.isna(value) else float(value)
+
+    cursor.executemany(
+        "INSERT OR REPLACE INTO a_stock_adj_factor (code, date, factor, cash, ratio) VALUES (?, ?, ?, ?, ?);",
+        [
+            (code, row["date"], float(row["factor"]), _opt(row, "cash"), _opt(row, "ratio"))
+            for row in df_factor.to_dict("records")
+        ],
+    )
+
+
+def save_adj_factors_to_db(code: str, df_factor: pd.DataFrame) -> None:
+    """将复权因子变化点（可含 cash/ratio 仿射项）upsert 到 a_stock_adj_factor。"""
+    if df_factor.empty:
+        return
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        _upsert_adj_factors(conn.cursor(), code, df_factor)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def sync_kline_raw(code: str) -> int:
+    """
+    增量同步不复权日线与复权因子，返回本次写入的 K 线条数。
+
+    从库中最后一根 K 线当天开始拉取（含当天，用于衔接上日收盘），
+    分红送转只会新增因子记录，历史 K 线无需重拉。出现新的除权时，
+    额外拉取最近一段前复权日线反推该次除权的仿射项（见 fit_adj_terms）。
+    若该代码只有旧版前复权数据而没有因子，则全量重建一次。
+    所有拉取完成后才在同一事务中删除旧数据并写入，拉取失败时库中数据保持不变。
+    """
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        last_bar = conn.execute(
+            "SELECT date, close FROM a_stock_kline_daily WHERE code=? ORDER BY date DESC LIMIT 1;",
+            (code,),
+        ).fetchone()
+        last_factor = conn.execute(
+            "SELECT factor, date FROM a_stock_adj_factor WHERE code=? ORDER BY date DESC LIMIT 1;",
+            (code,),
+        ).fetchone()
+        rebuild = bool(last_bar) and not last_factor
+        incremental = bool(last_bar) and not rebuild
+        recent = pd.DataFrame()
+        if incremental:
+            # 只回看上一个因子变化点及之后的 K 线，保证拟合区段内没有更早的除权
+            recent = pd.read_sql_query(
+                "SELECT date, open, close, high, low FROM a_stock_kline_daily WHERE code=? AND date>=? "
+                "ORDER BY date DESC LIMIT ?;",
+                conn,
+                params=(code, last_factor[1], ADJ_FIT_LOOKBACK),
+            ).iloc[::-1]
+    finally:
+        conn.close()
+
+    if incremental:
+        df_raw = fetch_kline_history(code, beg=last_bar[0].replace("-", ""), fqt="0")
+        df_raw = df_raw[df_raw["date"] > last_bar[0]] if not df_raw.empty else df_raw
+        df_factor = compute_adj_factors(df_raw, base_factor=last_factor[0], prev_close=last_bar[1])
+        events, window = df_factor["date"].tolist(), pd.concat([recent, df_raw], ignore_index=True)
+        beg = recent["date"].iloc[0].replace("-", "")
+        if events and (window["date"] < events[0]).sum() < 2:
+            # 首个新除权之前可用 K 线不足 2 根，无法拟合，按因子比例处理
+            events = []
+    else:
+        df_raw = fetch_kline_history(code, fqt="0")
+        df_factor = compute_adj_factors(df_raw)
+        # 首行是起点而非除权
+        events, window, beg = df_factor["date"].tolist()[1:], df_raw, "0"
+    if events:
+        terms = fit_adj_terms(window, fetch_kline_history(code, beg=beg, fqt="1"), events)
+        df_factor = df_factor.merge(terms, on="date", how="left")
+    if not incremental and not df_factor.empty:
+        df_factor.loc[0, ["cash", "ratio"]] = 0.0
+
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        cursor = conn.cursor()
+        if rebuild:
+            cursor.execute("DELETE FROM a_stock_kline_daily WHERE code=?;", (code,))
+        _upsert_kline(cursor, code, df_raw)
+        _upsert_adj_factors(cursor, code, df_factor)
+        conn.commit()
+    finally:
+        conn.close()
+    return len(df_raw)
+
+
+def sync_index_kline(code: str) -> int:
+    """
+    增量同步指数日线（如 sh000300 沪深 300、sz399001 深证成指），返回本次写入条数。
+    指数无除权，不写复权因子；以带前缀的代码入库，与 6 位股票代码互不冲突。
+    """
+    if code[:2].lower() not in INDEX_MARKETS:
+        raise ValueError(f"index code must start with sh/sz: {code}")
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        last_bar = conn.execute(
+            "SELECT date FROM a_stock_kline_daily WHERE code=? ORDER BY date DESC LIMIT 1;", (code,)
+        ).fetchone()
+    finally:
+        conn.close()
+    beg = last_bar[0].replace("-", "") if last_bar else "0"
+    df = fetch_kline_history(code, beg=beg, fqt="0")
+    if last_bar and not df.empty:
+        df = df[df["date"] > last_bar[0]]
+    save_kline_to_db(code, df.drop(columns=["pre_close"], errors="ignore"))
+    return len(df)
+
+
+def _affine_terms(factors: pd.DataFrame) -> tuple:
+    """
+    因子表各行的仿射项 (cash, ratio)；首行为起点恒为恒等，
+    缺少仿射项的除权按因子比例视为纯送转（cash=0）。
+    """
+    factor = factors["factor"].to_numpy(dtype=float)
+    cash = pd.to_numeric(factors["cash"], errors="coerce").fillna(0.0).to_numpy(dtype=float, copy=True)
+    ratio = pd.to_numeric(factors["ratio"], errors="coerce").to_numpy(dtype=float, copy=True)
+    implied = np.ones_like(factor)
+    implied[1:] = factor[1:] / factor[:-1]
+    ratio = np.where(np.isnan(ratio), implied - 1.0, ratio)
+    cash[0], ratio[0] = 0.0, 0.0
+    return cash, ratio
+
+
+def load_kline(code: str, adjust: str = "qfq", beg: str = "", end: str = "9999-99-99") -> pd.DataFrame:
+    """
+    读取库中日线并在读取时复权（列：date, open, close, high, low, volume, amount）。
+    adjust：qfq 前复权（以最新价格为基准），hfq 后复权，空字符串为不复权。
+    与东财一致按除权仿射项叠加：前复权对其后每次除权做 (P - cash) / (1 + ratio)，
+    后复权对当日及之前每次除权做逆变换 P * (1 + ratio) + cash，早期前复权价可能为负。
+    """
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        df = pd.read_sql_query(
+            "SELECT date, open, close, high, low, volume, amount FROM a_stock_kline_daily "
+            "WHERE code=? AND date>=? AND date<=? ORDER BY date;",
+            conn,
+            params=(code, beg, end),
+        )
+        factors = pd.read_sql_query(
+            "SELECT date, factor, cash, ratio FROM a_stock_adj_factor WHERE code=? ORDER BY date;",
+            conn,
+            params=(code,),
+        )
+    finally:
+        conn.close()
+    if df.empty or not adjust or factors.empty:
+        return df
+    if adjust not in ("qfq", "hfq"):
+        raise ValueError(f"unsupported adjust: {adjust}")
+
+    # 每个因子变化点对应一个区段的复合仿射变换 price' = a * P + b
+    cash, ratio = _affine_terms(factors)
+    n = len(factors)
+    a, b = np.ones(n), np.zeros(n)
+    if adjust == "qfq":
+        for k in range(n - 2, -1, -1):
+            a[k] = a[k + 1] / (1.0 + ratio[k + 1])
+            b[k] = b[k + 1] - a[k + 1] * cash[k + 1] / (1.0 + ratio[k + 1])
+    else:
+        for k in range(1, n):
+            a[k] = a[k - 1] * (1.0 + ratio[k])
+            b[k] = b[k - 1] + a[k - 1] * cash[k]
+
+    # 每根 K 线取不晚于当日的最近一个因子变化点（早于首个变化点的按首个处理）
+    pos = np.searchsorted(factors["date"].to_numpy(), df["date"].to_numpy(), side="right") - 1
+    pos = np.clip(pos, 0, None)
+    cols = list(ADJUST_PRICE_COLUMNS)
+    df[cols] = np.round(df[cols].to_numpy() * a[pos][:, None] + b[pos][:, None], 2)
+    return df
+
+
+def _upsert_kline(cursor: sqlite3.Cursor, code: str, df_kline: pd.DataFrame) -> None:
+    if df_kline.empty:
+        return
+    sql = """
+    INSERT OR REPLACE INTO a_stock_kline_daily (
+      code, date, open, close, high, low, volume, amount
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?);
+    """
+    payload = [
+        (
+            code,
+            row["date"],
+            row["open"],
+            row["close"],
+            row["high"],
+            row["low"],
+            row["volume"],
+            row["amount"],
+        )
+        for _, row in df_kline.iterrows()
+    ]
+    cursor.executemany(sql, payload)
+
+
 def save_kline_to_db(code: str, df_kline: pd.DataFrame) -> None:
     """将日线数据 upsert 到 a_stock_kline_daily（code+date 唯一）。"""
     if df_kline.empty:
         return
     conn = sqlite3.connect(DB_PATH)
     try:
-        cursor = conn.cursor()
-        sql = """
-        INSERT OR REPLACE INTO a_stock_kline_daily (
-          code, date, open, close, high, low, volume, amount
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?);
-        """
-        payload = [
-            (
-                code,
-                row["date"],
-                row["open"],
-                row["close"],
-                row["high"],
-                row["low"],
-                row["volume"],
-                row["amount"],
-            )
-            for _, row in df_kline.iterrows()
-        ]
-        cursor.executemany(sql, payload)
+        _upsert_kline(conn.cursor(), code, df_kline)
         conn.commit()
     finally:
         conn.close()
@@ -401,7 +692,8 @@ def main() -> None:
     1) 初始化数据库与表结构
     2) 全量拉取 A 股主表并写入 SQLite
     3) 从数据库取出部分代码刷新实时价格字段
-    4) 针对示例代码获取日线历史并入库
+    4) 针对示例代码增量同步不复权日线与复权因子，读取时前复权
+    5) 增量同步沪深 300 指数日线，供风险分析计算 beta
     """
     init_db()
     _log(f"数据库初始化完成，路径：{DB_PATH}")
@@ -431,9 +723,10 @@ def main() -> None:
         sample_code = codes[0] if codes else "000001"
         _log("非交易时段，跳过实时价格刷新，仅拉取主表和日线示例。")
 
-    kline_df = fetch_kline_history(sample_code)
-    save_kline_to_db(sample_code, kline_df)
-    _log(f"{sample_code} 日线数据已写入，共 {len(kline_df)} 条。")
+    added = sync_kline_raw(sample_code)
+    kline_df = load_kline(sample_code, adjust="qfq")
+    _log(f"{sample_code} 日线数据新增 {added} 条，前复权可读 {len(kline_df)} 条。")
+    _log(f"sh000300 指数日线新增 {sync_index_kline('sh000300')} 条。")
 
 
 if __name__ == "__main__":
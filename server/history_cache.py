@@ -0,0 +1,145 @@
+"""
+akshare /history 日线缓存：按 (symbol, adjust) 缓存完整日线 DataFrame。
+
+- LRU 淘汰，按 DataFrame 实际内存占用计算容量上限
+- 交易日感知过期：缓存持有到下一个收盘（工作日 15:00，沪深时区）
+- 请求合并：同一 key 的并发未命中只发起一次上游请求，其余调用方等待同一结果
+- 命中/未命中/合并/淘汰计数，便于评估缓存容量
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional, Tuple
+
+import pandas as pd
+
+from eastmoney import SH_TZ
+
+# 默认内存上限 64MB，单只股票全历史日线约几百 KB
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+CLOSE_HHMM = (15, 0)
+
+CacheKey = Tuple[str, str]
+
+
+def next_close(now: Optional[datetime] = None) -> datetime:
+    """返回不早于 now 之后的下一个收盘时刻（工作日 15:00，沪深时区），不考虑法定节假日。"""
+    base = now or datetime.now(tz=SH_TZ)
+    if base.tzinfo is None:
+        base = base.replace(tzinfo=SH_TZ)
+    else:
+        base = base.astimezone(SH_TZ)
+    close = base.replace(hour=CLOSE_HHMM[0], minute=CLOSE_HHMM[1], second=0, microsecond=0)
+    if base >= close:
+        close += timedelta(days=1)
+    while close.weekday() >= 5:
+        close += timedelta(days=1)
+    return close
+
+
+class HistoryCache:
+    """带请求合并的内存受限 LRU 日线缓存（线程安全）。"""
+
+    def __init__(
+        self,
+        fetch: Callable[[str, str], pd.DataFrame],
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        clock: Callable[[], datetime] = lambda: datetime.now(tz=SH_TZ),
+    ) -> None:
+        self._fetch = fetch
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._lock = threading.Lock()
+        # key -> (DataFrame, 过期时间, 占用字节)
+        self._entries: "OrderedDict[CacheKey, Tuple[pd.DataFrame, datetime, int]]" = OrderedDict()
+        self._inflight: Dict[CacheKey, Future] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, symbol: str, adjust: str = "qfq") -> pd.DataFrame:
+        """读取日线，未命中时拉取上游；并发请求同一 key 共享一次拉取。"""
+        key = (symbol, adjust)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self._clock() < entry[1]:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                self._remove(key)
+                self.expirations += 1
+            fut = self._inflight.get(key)
+            if fut is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                self.misses += 1
+                fut = Future()
+                self._inflight[key] = fut
+                leader = True
+
+        if not leader:
+            return fut.result()
+
+        try:
+            df = self._fetch(symbol, adjust)
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            fut.set_exception(e)
+            raise
+        with self._lock:
+            self._inflight.pop(key, None)
+            # 空结果可能是停牌或上游抖动，不缓存
+            if not df.empty:
+                self._store(key, df)
+        fut.set_result(df)
+        return df
+
+    def _store(self, key: CacheKey, df: pd.DataFrame) -> None:
+        size = int(df.memory_usage(deep=True).sum())
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (df, next_close(self._clock()), size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: CacheKey) -> None:
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self) -> None:
+        """清空缓存与计数（不影响进行中的请求）。"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = self.misses = self.coalesced = self.evictions = self.expirations = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "inflight": len(self._inflight),
+                "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+            }
@@ -431,6 +431,19 @@ const fetchYingweiQuotes = async (symbols = []) => {
   })).filter((m) => m.symbol);
 };
 
+// 将 akshare 服务的列式响应（{ field: [...] }）还原为逐行对象
+const columnsToRows = (columns = {}) => {
+  const keys = Object.keys(columns);
+  const count = keys.length ? columns[keys[0]].length : 0;
+  const rows = new Array(count);
+  for (let i = 0; i < count; i += 1) {
+    const row = {};
+    for (const key of keys) row[key] = columns[key][i];
+    rows[i] = row;
+  }
+  return rows;
+};
+
 const fetchAkshareQuotes = async (symbols = []) => {
   const base = AKSHARE_BASE;
   if (!base || !symbols.length) return [];
@@ -459,11 +472,12 @@ const fetchAkshareMaster = async () => {
   const base = AKSHARE_BASE;
   if (!base) return [];
   const normalized = base.replace(/\/$/, '');
-  const url = `${normalized}/master`;
+  // 列式格式：字段名只出现一次，响应体与 JSON.parse 开销显著降低
+  const url = `${normalized}/master?format=columns`;
   const resp = await fetch(url, { headers: buildBrowserHeaders(base) });
   if (!resp.ok) throw new Error('akshare master error');
   const json = await resp.json();
-  const list = Array.isArray(json?.data) ? json.data : [];
+  const list = json?.format === 'columns' ? columnsToRows(json.data) : Array.isArray(json?.data) ? json.data : [];
   const now = new Date().toISOString();
   return list.map((item) => ({
     symbol: item.symbol,
@@ -0,0 +1,259 @@
+"""
+主表日终快照归档：每个交易日将 fetch_a_stock_list 结果追加为一个压缩列式文件。
+
+目录结构（ARCHIVE_DIR）：
+- codes.npy：全局代码字典（S6 定长数组，只追加），数组下标即代码编号
+- YYYYMMDD.npz：当日快照（np.savez_compressed），含 code_id(int32)、market_id(int8)、
+  name(UTF-8) 以及 ARCHIVE_FIELDS 中每个数值字段一列 float64
+
+a_stock_master 只保留最新状态，本归档用于历史横截面因子与选股回测，
+load_master_cube 将日期区间读取为 date x code x field 的三维数组。
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+import eastmoney
+
+# 归档目录，可通过环境变量 MASTER_ARCHIVE_DIR 覆盖
+ARCHIVE_DIR = os.getenv("MASTER_ARCHIVE_DIR", "master_archive")
+
+# 与 fetch_a_stock_list 返回的数值字段一致
+ARCHIVE_FIELDS = (
+    "last",
+    "chg_pct",
+    "chg",
+    "volume",
+    "amount",
+    "high",
+    "low",
+    "open",
+    "pre_close",
+    "total_mv",
+    "float_mv",
+    "pe_dynamic",
+    "pb",
+)
+
+# 集合竞价开始与收盘时刻（沪深时区），其间主表为盘中数据，不归档
+OPEN_HHMM = (9, 15)
+CLOSE_HHMM = (15, 0)
+# 判断是否与上一归档日重复（休市日）时比较的成交字段
+DUPLICATE_CHECK_FIELDS = ("last", "volume", "amount")
+
+CODE_DTYPE = np.dtype("S6")
+CODES_FILE = "codes.npy"
+
+
+def _codes_path() -> str:
+    return os.path.join(ARCHIVE_DIR, CODES_FILE)
+
+
+def _day_path(trade_date: str) -> str:
+    return os.path.join(ARCHIVE_DIR, f"{trade_date}.npz")
+
+
+def load_code_dict() -> np.ndarray:
+    """读取全局代码字典，不存在时返回空数组。"""
+    path = _codes_path()
+    if not os.path.exists(path):
+        return np.empty(0, dtype=CODE_DTYPE)
+    return np.load(path)
+
+
+def _encode_codes(codes: Iterable[str]) -> np.ndarray:
+    """将代码编码为字典编号，新代码追加到字典末尾（原子替换写入）。"""
+    raw = np.asarray([str(c) for c in codes], dtype=CODE_DTYPE)
+    known = load_code_dict()
+    new_codes = np.setdiff1d(np.unique(raw), known)
+    if new_codes.size:
+        known = np.concatenate([known, new_codes])
+        tmp = _codes_path() + ".tmp.npy"
+        np.save(tmp, known)
+        os.replace(tmp, _codes_path())
+    # 字典无序，借助排序下标做向量化查找
+    order = np.argsort(known)
+    pos = np.searchsorted(known, raw, sorter=order)
+    return order[pos].astype(np.int32)
+
+
+def archive_master_snapshot(df: pd.DataFrame, trade_date: Optional[str] = None) -> str:
+    """
+    将主表 DataFrame 写为当日压缩快照并返回文件路径，同一交易日重复写入会覆盖。
+    trade_date 格式 YYYYMMDD，默认取沪深时区当天。
+    """
+    if df.empty:
+        raise ValueError("empty master snapshot")
+    trade_date = trade_date or datetime.now(tz=eastmoney.SH_TZ).strftime("%Y%m%d")
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    df = df.drop_duplicates(subset="code", keep="last")
+    columns = {"code_id": _encode_codes(df["code"])}
+    if "market_id" in df.columns:
+        columns["market_id"] = pd.to_numeric(df["market_id"], errors="coerce").fillna(0).to_numpy(np.int8)
+    else:
+        columns["market_id"] = np.zeros(len(df), dtype=np.int8)
+    if "name" in df.columns:
+        columns["name"] = df["name"].fillna("").astype(str).to_numpy(dtype=str)
+    else:
+        columns["name"] = np.array([], dtype=str)
+    for field in ARCHIVE_FIELDS:
+        if field in df.columns:
+            columns[field] = pd.to_numeric(df[field], errors="coerce").to_numpy(np.float64)
+        else:
+            columns[field] = np.full(len(df), np.nan)
+    # 先写临时文件再替换，避免读取方看到半个文件
+    path = _day_path(trade_date)
+    tmp = path + ".tmp.npz"
+    np.savez_compressed(tmp, **columns)
+    os.replace(tmp, path)
+    return path
+
+
+def list_archived_dates(start: str = "00000000", end: str = "99999999") -> List[str]:
+    """列出区间内（含两端）已归档的交易日，升序。"""
+    if not os.path.isdir(ARCHIVE_DIR):
+        return []
+    dates = []
+    for fname in os.listdir(ARCHIVE_DIR):
+        stem, ext = os.path.splitext(fname)
+        if ext == ".npz" and len(stem) == 8 and stem.isdigit() and start <= stem <= end:
+            dates.append(stem)
+    return sorted(dates)
+
+
+def load_master_day(trade_date: str) -> pd.DataFrame:
+    """读取单日快照为 DataFrame（列：code, market_id, name + ARCHIVE_FIELDS）。"""
+    codes = load_code_dict()
+    with np.load(_day_path(trade_date)) as npz:
+        data = {"code": np.char.decode(codes[npz["code_id"]]), "market_id": npz["market_id"]}
+        if npz["name"].size:
+            data["name"] = npz["name"]
+        for field in ARCHIVE_FIELDS:
+            data[field] = npz[field]
+    return pd.DataFrame(data)
+
+
+def load_master_cube(
+    start: str,
+    end: str,
+    fields: Sequence[str] = ARCHIVE_FIELDS,
+    out_path: Optional[str] = None,
+) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """
+    将 [start, end] 区间的快照读取为 (dates, codes, cube)。
+
+    cube 形状为 len(dates) x len(codes) x len(fields)，float64，缺失值为 NaN；
+    codes 为区间内出现过的代码并集（按字典编号排序）。
+    指定 out_path 时 cube 落盘为 np.memmap，适合长区间全市场数据按需分页访问。
+    """
+    for field in fields:
+        if field not in ARCHIVE_FIELDS:
+            raise ValueError(f"unknown field: {field}")
+    dates = list_archived_dates(start, end)
+    code_dict = load_code_dict()
+
+    # 第一遍只读编号列，确定代码并集
+    day_ids = []
+    for d in dates:
+        with np.load(_day_path(d)) as npz:
+            day_ids.append(npz["code_id"])
+    universe = np.unique(np.concatenate(day_ids)) if day_ids else np.empty(0, dtype=np.int32)
+
+    shape = (len(dates), len(universe), len(fields))
+    if out_path:
+        cube = np.lib.format.open_memmap(out_path, mode="w+", dtype=np.float64, shape=shape)
+        cube[:] = np.nan
+    else:
+        cube = np.full(shape, np.nan)
+    for i, (d, ids) in enumerate(zip(dates, day_ids)):
+        cols = np.searchsorted(universe, ids)
+        with np.load(_day_path(d)) as npz:
+            for k, field in enumerate(fields):
+                cube[i, cols, k] = npz[field]
+    if out_path:
+        cube.flush()
+    codes = np.char.decode(code_dict[universe]) if universe.size else np.empty(0, dtype=str)
+    return dates, codes, cube
+
+
+def _duplicate_of_previous(df: pd.DataFrame, trade_date: str) -> Optional[str]:
+    """
+    若快照与 trade_date 之前最近一个归档日的成交数据完全相同（节假日接口仍返回上一交易日数据），
+    返回该归档日，否则返回 None。
+    """
+    previous = list_archived_dates(end=str(int(trade_date) - 1).zfill(8))
+    if not previous:
+        return None
+    prev = load_master_day(previous[-1])
+    cur = df.drop_duplicates(subset="code", keep="last").assign(code=lambda d: d["code"].astype(str))
+    merged = prev.merge(cur, on="code", suffixes=("_prev", ""))
+    if merged.empty or len(merged) != len(prev):
+        return None
+    for field in DUPLICATE_CHECK_FIELDS:
+        if field not in cur.columns:
+            return None
+        now_values = pd.to_numeric(merged[field], errors="coerce").to_numpy(np.float64)
+        if not np.array_equal(merged[f"{field}_prev"].to_numpy(), now_values, equal_nan=True):
+            return None
+    return previous[-1]
+
+
+def last_completed_session(now: datetime) -> str:
+    """now 时刻最近一个已收盘的工作日（YYYYMMDD），不考虑法定节假日。"""
+    day = now
+    if day.weekday() >= 5 or (day.hour, day.minute) < CLOSE_HHMM:
+        day -= timedelta(days=1)
+        while day.weekday() >= 5:
+            day -= timedelta(days=1)
+    return day.strftime("%Y%m%d")
+
+
+def run_eod_archive(trade_date: Optional[str] = None, now: Optional[datetime] = None) -> Optional[str]:
+    """
+    日终任务：全量拉取主表并归档。
+
+    主表接口只返回当前行情，因此只能归档最近一个已收盘的交易日：
+    - 未指定 trade_date 时，周末或收盘（15:00）前不归档，避免写入盘中半成品数据
+    - 指定 trade_date（错过日终时补录）时，必须等于最近一个已收盘交易日，且不在当日盘中（09:15-15:00）运行
+    快照与上一归档日成交数据完全相同时视为休市日跳过。
+    """
+    now = now or datetime.now(tz=eastmoney.SH_TZ)
+    in_session = now.weekday() < 5 and OPEN_HHMM <= (now.hour, now.minute) < CLOSE_HHMM
+    if trade_date is None:
+        if now.weekday() >= 5:
+            eastmoney._log("周末不归档主表快照。")
+            return None
+        if in_session or (now.hour, now.minute) < OPEN_HHMM:
+            eastmoney._log("尚未收盘，不归档主表快照；次日开盘前可用 --date 补录上一交易日。")
+            return None
+        trade_date = now.strftime("%Y%m%d")
+    else:
+        if in_session:
+            eastmoney._log("盘中主表为当日实时数据，不能补录；请在收盘后或次日开盘前运行。")
+            return None
+        expected = last_completed_session(now)
+        if trade_date != expected:
+            eastmoney._log(f"主表接口只能取得 {expected} 的收盘数据，拒绝补录 {trade_date}。")
+            return None
+    df = eastmoney.fetch_a_stock_list()
+    duplicate = _duplicate_of_previous(df, trade_date)
+    if duplicate:
+        eastmoney._log(f"{trade_date} 主表数据与 {duplicate} 相同，判定为休市日，跳过归档。")
+        return None
+    path = archive_master_snapshot(df, trade_date)
+    eastmoney._log(f"主表快照已归档：{path}，记录数：{len(df)}")
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--date", default=None, help="补录最近一个已收盘交易日 YYYYMMDD（盘中不可用），默认今天")
+    args = parser.parse_args()
+    run_eod_archive(args.date)
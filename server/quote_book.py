@@ -0,0 +1,376 @@
+"""
+共享内存行情簿：单一刷新进程写入，多个 worker 进程零拷贝读取。
+
+布局固定（均为定长数组，按 capacity 预分配）：
+- 头部 16 个 uint64：magic, seq, capacity, count, codes_gen, updated_ms, owner_pid, generation,
+  heartbeat_ms, interval_ms, closed, 其余保留
+- codes: capacity 个 S8 定长代码
+- names: capacity 个 S32 定长名称（UTF-8）
+- values: 7 x capacity 的 float64 列，依次为 last, pre_close, high, low, open, volume, amount
+
+并发控制采用 seqlock：写入前 seq 置为奇数，写完再加一变为偶数；
+读取方在 seq 为偶数且前后一致时才认为数据有效，否则重试。
+字段集合与 eastmoney.fetch_realtime_quote / a_stock_master 保持一致。
+
+刷新进程重启会删除旧段并新建同名段，已挂载的读取方仍映射旧段；
+读取方通过 is_stale()（关闭标记或心跳超时）发现后应按名称重新挂载。
+同名段的写入方仍存活时 create() 拒绝接管，保证同一名称只有一个刷新进程。
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# 默认共享内存名称，可通过环境变量 QUOTE_BOOK_NAME 覆盖
+DEFAULT_NAME = os.getenv("QUOTE_BOOK_NAME", "alphatrader_quote_book")
+# 全市场 A 股约 5400 只，预留余量
+DEFAULT_CAPACITY = 8192
+
+MAGIC = 0x51424F4F4B303032  # "QBOOK002"
+FIELDS = ("last", "pre_close", "high", "low", "open", "volume", "amount")
+
+CODE_DTYPE = np.dtype("S8")
+NAME_DTYPE = np.dtype("S32")
+HEADER_SLOTS = 16
+(
+    _H_MAGIC, _H_SEQ, _H_CAPACITY, _H_COUNT, _H_CODES_GEN, _H_UPDATED_MS, _H_OWNER_PID,
+    _H_GENERATION, _H_HEARTBEAT_MS, _H_INTERVAL_MS, _H_CLOSED,
+) = range(11)
+
+DEFAULT_INTERVAL = 3.0
+# 心跳超过 STALE_INTERVALS 个刷新周期未更新，视为刷新进程已退出（读取方应重新挂载或回退）
+STALE_INTERVALS = 10
+
+# seqlock 读取超时（秒）：写入方被抢占时读取方让出 CPU 等待，超时则认为写入方异常
+READ_TIMEOUT = 0.5
+
+
+def _encode_name(value) -> bytes:
+    """名称按 UTF-8 编码并截断到 NAME_DTYPE 宽度，截断点落在字符边界上。"""
+    raw = str(value).encode("utf-8")[: NAME_DTYPE.itemsize]
+    return raw.decode("utf-8", "ignore").encode("utf-8")
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # 进程存在但属于其他用户
+        return True
+    return True
+
+
+def _live_owner(shm: shared_memory.SharedMemory) -> int:
+    """已存在的共享内存段若仍有存活写入方，返回其 pid，否则返回 0（可安全清理）。"""
+    if shm.size < HEADER_SLOTS * 8:
+        return 0
+    header = np.ndarray((HEADER_SLOTS,), dtype=np.uint64, buffer=shm.buf)
+    try:
+        if int(header[_H_MAGIC]) != MAGIC or int(header[_H_CLOSED]):
+            return 0
+        pid = int(header[_H_OWNER_PID])
+        now_ms = int(time.time() * 1000)
+        if now_ms - int(header[_H_HEARTBEAT_MS]) > STALE_INTERVALS * int(header[_H_INTERVAL_MS]):
+            return 0
+        return pid if pid and _pid_alive(pid) else 0
+    finally:
+        del header
+
+
+def _layout(capacity: int) -> Dict[str, int]:
+    """计算各段在共享内存中的偏移量，保证 float64 段 8 字节对齐。"""
+    header_size = HEADER_SLOTS * 8
+    codes_off = header_size
+    names_off = codes_off + capacity * CODE_DTYPE.itemsize
+    values_off = names_off + capacity * NAME_DTYPE.itemsize
+    values_off = (values_off + 7) // 8 * 8
+    total = values_off + len(FIELDS) * capacity * 8
+    return {"codes": codes_off, "names": names_off, "values": values_off, "total": total}
+
+
+class QuoteBook:
+    """
+    共享内存行情簿句柄。
+
+    使用 QuoteBook.create() 在刷新进程中创建（唯一写入方），
+    worker 进程使用 QuoteBook.attach() 挂载只读视图。
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool) -> None:
+        self._shm = shm
+        self._owner = owner
+        buf = shm.buf
+        self._header = np.ndarray((HEADER_SLOTS,), dtype=np.uint64, buffer=buf)
+        if int(self._header[_H_MAGIC]) != MAGIC:
+            raise ValueError(f"共享内存 {shm.name} 不是有效的行情簿")
+        capacity = int(self._header[_H_CAPACITY])
+        layout = _layout(capacity)
+        self.capacity = capacity
+        self.codes = np.ndarray((capacity,), dtype=CODE_DTYPE, buffer=buf, offset=layout["codes"])
+        self.names = np.ndarray((capacity,), dtype=NAME_DTYPE, buffer=buf, offset=layout["names"])
+        self.values = np.ndarray(
+            (len(FIELDS), capacity), dtype=np.float64, buffer=buf, offset=layout["values"]
+        )
+        # 读取方的代码 -> 行号索引缓存，仅在 codes_gen 变化时重建
+        self._index: Dict[str, int] = {}
+        self._index_gen = -1
+
+    @classmethod
+    def create(
+        cls, name: str = DEFAULT_NAME, capacity: int = DEFAULT_CAPACITY, interval: float = DEFAULT_INTERVAL
+    ) -> "QuoteBook":
+        """
+        创建新的行情簿；若同名段残留（刷新进程异常退出），先清理再创建。
+        同名段的写入方仍存活（未关闭、心跳未超时且进程存在）时抛出 FileExistsError，避免两个刷新进程争用。
+        每次创建写入随机代号（generation），读取方据此区分重启前后的共享内存段。
+        """
+        layout = _layout(capacity)
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=layout["total"])
+        except FileExistsError:
+            existing = shared_memory.SharedMemory(name=name)
+            owner_pid = _live_owner(existing)
+            if owner_pid:
+                existing.close()
+                resource_tracker.unregister(existing._name, "shared_memory")  # type: ignore[attr-defined]
+                raise FileExistsError(f"行情簿 {name} 已由存活的刷新进程（pid={owner_pid}）写入")
+            existing.close()
+            existing.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=layout["total"])
+        header = np.ndarray((HEADER_SLOTS,), dtype=np.uint64, buffer=shm.buf)
+        header[:] = 0
+        header[_H_CAPACITY] = capacity
+        header[_H_OWNER_PID] = os.getpid()
+        header[_H_GENERATION] = int.from_bytes(os.urandom(8), "little") >> 1
+        header[_H_INTERVAL_MS] = int(interval * 1000)
+        header[_H_HEARTBEAT_MS] = int(time.time() * 1000)
+        header[_H_MAGIC] = MAGIC
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str = DEFAULT_NAME) -> "QuoteBook":
+        """挂载已存在的行情簿（只读使用）。"""
+        shm = shared_memory.SharedMemory(name=name)
+        book = cls(shm, owner=False)
+        # 挂载方不拥有该段，避免 resource_tracker 在进程退出时误删（同进程挂载时由创建方负责）
+        if int(book._header[_H_OWNER_PID]) != os.getpid():
+            resource_tracker.unregister(shm._name, "shared_memory")  # type: ignore[attr-defined]
+        return book
+
+    def close(self) -> None:
+        """释放本进程映射；写入方同时标记关闭并删除共享内存段。"""
+        if self._owner:
+            # 已挂载的读取方仍映射着旧段，通过关闭标记得知需要重新挂载
+            self._header[_H_CLOSED] = 1
+        # 先释放 numpy 视图，否则 mmap 无法关闭
+        self._header = self.codes = self.names = self.values = None  # type: ignore[assignment]
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+    def __enter__(self) -> "QuoteBook":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # ---------------- 写入（仅刷新进程） ----------------
+
+    def write_frame(self, df: pd.DataFrame) -> int:
+        """
+        将 fetch_a_stock_list 风格的 DataFrame（含 code, name 及 FIELDS 列）整体写入。
+        缺失的数值列按 0 处理，超出 capacity 的行会被截断。返回写入行数。
+        """
+        if not self._owner:
+            raise PermissionError("只有创建方可以写入行情簿")
+        n = min(len(df), self.capacity)
+        codes = df["code"].astype(str).to_numpy()[:n].astype(CODE_DTYPE)
+        if "name" in df.columns:
+            names = np.array([_encode_name(v) for v in df["name"].to_numpy()[:n]], dtype=NAME_DTYPE)
+        else:
+            names = np.zeros(n, dtype=NAME_DTYPE)
+        block = np.zeros((len(FIELDS), n), dtype=np.float64)
+        for i, field in enumerate(FIELDS):
+            if field in df.columns:
+                block[i] = pd.to_numeric(df[field], errors="coerce").fillna(0.0).to_numpy()[:n]
+
+        header = self._header
+        codes_changed = n != int(header[_H_COUNT]) or not np.array_equal(self.codes[:n], codes)
+        # seqlock：奇数表示写入中
+        header[_H_SEQ] += 1
+        if codes_changed:
+            self.codes[:n] = codes
+            self.codes[n:] = b""
+            header[_H_CODES_GEN] += 1
+        self.names[:n] = names
+        self.values[:, :n] = block
+        self.values[:, n:] = 0.0
+        header[_H_COUNT] = n
+        header[_H_UPDATED_MS] = header[_H_HEARTBEAT_MS] = int(time.time() * 1000)
+        header[_H_SEQ] += 1
+        return n
+
+    def heartbeat(self) -> None:
+        """刷新进程存活标记；非交易时段不写数据时也需定期调用。"""
+        self._header[_H_HEARTBEAT_MS] = int(time.time() * 1000)
+
+    def write_quotes(self, quotes: Iterable[Dict]) -> int:
+        """写入 fetch_realtime_quote 返回的字典列表（无 amount 字段时记为 0）。"""
+        return self.write_frame(pd.DataFrame(list(quotes)))
+
+    # ---------------- 读取（任意进程） ----------------
+
+    @property
+    def seq(self) -> int:
+        """当前版本号；偶数表示数据稳定。"""
+        return int(self._header[_H_SEQ])
+
+    @property
+    def updated_ms(self) -> int:
+        """最近一次写入完成的毫秒时间戳，0 表示尚未写入。"""
+        return int(self._header[_H_UPDATED_MS])
+
+    @property
+    def generation(self) -> int:
+        """创建时写入的随机代号，刷新进程重启后变化。"""
+        return int(self._header[_H_GENERATION])
+
+    def is_stale(self, now_ms: Optional[int] = None) -> bool:
+        """写入方已关闭，或心跳超过 STALE_INTERVALS 个刷新周期未更新。"""
+        header = self._header
+        if int(header[_H_CLOSED]):
+            return True
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        return now_ms - int(header[_H_HEARTBEAT_MS]) > STALE_INTERVALS * int(header[_H_INTERVAL_MS])
+
+    def _read_consistent(self, reader: Callable[[int], object]):
+        """在 seqlock 保护下执行 reader(count)，直到读到一致版本；超过 READ_TIMEOUT 抛出 TimeoutError。"""
+        header = self._header
+        deadline = time.monotonic() + READ_TIMEOUT
+        while True:
+            before = int(header[_H_SEQ])
+            if not before & 1:
+                result = reader(int(header[_H_COUNT]))
+                if int(header[_H_SEQ]) == before:
+                    return result
+            if time.monotonic() >= deadline:
+                raise TimeoutError("行情簿持续处于写入状态，读取失败")
+            # 写入中：让出 CPU，避免与写入方争抢
+            time.sleep(0)
+
+    def _ensure_index(self) -> None:
+        """代码集合变化时重建 code -> 行号索引。"""
+        gen = int(self._header[_H_CODES_GEN])
+        if gen == self._index_gen:
+            return
+
+        def _build(count: int):
+            gen = int(self._header[_H_CODES_GEN])
+            return gen, {c.decode(): i for i, c in enumerate(self.codes[:count].tolist())}
+
+        self._index_gen, self._index = self._read_consistent(_build)
+
+    def view(self) -> Dict[str, np.ndarray]:
+        """
+        返回各字段的零拷贝 numpy 视图（长度为当前 count）。
+        视图随写入实时变化，需要一致快照时请使用 snapshot()/get_many()。
+        """
+        count = int(self._header[_H_COUNT])
+        data = {field: self.values[i, :count] for i, field in enumerate(FIELDS)}
+        data["code"] = self.codes[:count]
+        return data
+
+    def snapshot(self) -> pd.DataFrame:
+        """复制出一份一致的全市场快照 DataFrame（列：code, name + FIELDS）。"""
+
+        def _copy(count: int):
+            return self.codes[:count].copy(), self.names[:count].copy(), self.values[:, :count].copy()
+
+        codes, names, values = self._read_consistent(_copy)
+        data = {"code": np.char.decode(codes), "name": np.char.decode(names, "utf-8", "ignore")}
+        for i, field in enumerate(FIELDS):
+            data[field] = values[i]
+        return pd.DataFrame(data)
+
+    def get_many(self, codes: Iterable[str]) -> List[Dict]:
+        """按代码批量读取，返回与 fetch_realtime_quote 同名字段的字典列表，未命中的代码跳过。"""
+        codes = list(codes)
+        deadline = time.monotonic() + READ_TIMEOUT
+        while True:
+            self._ensure_index()
+            rows = [self._index[c] for c in codes if c in self._index]
+            if not rows:
+                return []
+            idx = np.asarray(rows, dtype=np.int64)
+            gen = self._index_gen
+
+            def _gather(count: int):
+                # 代码集合在建索引后发生变化时返回 None，重新建索引再读
+                if int(self._header[_H_CODES_GEN]) != gen:
+                    return None
+                return self.codes[idx].copy(), self.names[idx].copy(), self.values[:, idx].copy()
+
+            gathered = self._read_consistent(_gather)
+            if gathered is not None:
+                break
+            if time.monotonic() >= deadline:
+                raise TimeoutError("行情簿代码集合持续变化，读取失败")
+            time.sleep(0)
+        got_codes, got_names, values = gathered
+        result = []
+        for j in range(len(idx)):
+            item = {"code": got_codes[j].decode(), "name": got_names[j].decode("utf-8", "ignore")}
+            for i, field in enumerate(FIELDS):
+                item[field] = float(values[i, j])
+            result.append(item)
+        return result
+
+    def get(self, code: str) -> Optional[Dict]:
+        """读取单只股票，未命中返回 None。"""
+        items = self.get_many([code])
+        return items[0] if items else None
+
+
+def run_refresher(
+    name: str = DEFAULT_NAME,
+    interval: float = DEFAULT_INTERVAL,
+    capacity: int = DEFAULT_CAPACITY,
+    fetch: Optional[Callable[[], pd.DataFrame]] = None,
+    max_rounds: Optional[int] = None,
+) -> None:
+    """
+    刷新进程主循环：定期全量拉取并写入行情簿。
+    非交易时段仅在启动时拉取一次，之后按 interval 空转等待并更新心跳。
+    """
+    import eastmoney
+
+    fetch = fetch or eastmoney.fetch_a_stock_list
+    rounds = 0
+    with QuoteBook.create(name, capacity, interval) as book:
+        while max_rounds is None or rounds < max_rounds:
+            if rounds == 0 or eastmoney.is_trading_time():
+                try:
+                    n = book.write_frame(fetch())
+                    eastmoney._log(f"行情簿已刷新，记录数：{n}，seq={book.seq}")
+                except Exception as e:  # 上游波动时保留旧数据，下一轮重试
+                    eastmoney._log(f"行情簿刷新失败：{e}")
+            book.heartbeat()
+            rounds += 1
+            time.sleep(interval)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--name", default=DEFAULT_NAME)
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL)
+    parser.add_argument("--capacity", type=int, default=DEFAULT_CAPACITY)
+    args = parser.parse_args()
+    run_refresher(args.name, args.interval, args.capacity)
@@ -0,0 +1,232 @@
+"""
+多源行情路由：东财直连（eastmoney.fetch_realtime_quote）与 akshare（stock_zh_a_spot_em）。
+
+- 统一输出字段：code, name, last, pre_close, high, low, open, volume, amount, source
+- 对冲请求：首选源在延迟预算内未返回时，并发发起下一个源，先成功者胜出
+- 按源统计成功/失败、连续失败次数与 p95 延迟，失败按整体超时计入延迟样本，连续失败的源进入冷却期
+- 选源顺序：健康且有足够样本的源按 p95 升序，样本不足的源其次，冷却中的源排在最后仅作兜底
+- 非有限数值记为 0，名称为空或最新价为 0 的行（未知代码、停牌无价）丢弃，一条有效行都没有时按失败处理
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Deque, Dict, List, Optional, Sequence
+
+import numpy as np
+
+QuoteSource = Callable[[List[str]], List[Dict]]
+
+# 对冲延迟预算（秒）：有足够样本时取首选源 p95，并限制在该区间内
+HEDGE_MIN_DELAY = 0.05
+HEDGE_MAX_DELAY = 0.5
+# 整体超时（秒），所有源都未成功时抛出异常
+ROUTE_TIMEOUT = 8.0
+# 延迟样本窗口与计算 p95 所需的最少样本数
+LATENCY_WINDOW = 200
+MIN_SAMPLES = 5
+# 连续失败达到阈值后冷却的时长（秒）
+FAILURE_THRESHOLD = 3
+COOLDOWN_SECONDS = 30.0
+
+NORMALIZED_FIELDS = ("last", "pre_close", "high", "low", "open", "volume", "amount")
+
+
+class SourceHealth:
+    """单个行情源的健康度与延迟统计（线程安全）。"""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._lock = threading.Lock()
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.wins = 0
+        self.cooldown_until = 0.0
+        self.last_error = ""
+
+    def record_success(self, latency: float) -> None:
+        with self._lock:
+            self._latencies.append(latency)
+            self.successes += 1
+            self.consecutive_failures = 0
+            self.cooldown_until = 0.0
+
+    def record_failure(self, error: BaseException) -> None:
+        with self._lock:
+            # 失败按整体超时计入延迟，频繁失败的源 p95 随之变差
+            self._latencies.append(ROUTE_TIMEOUT)
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = str(error)
+            if self.consecutive_failures >= FAILURE_THRESHOLD:
+                self.cooldown_until = time.monotonic() + COOLDOWN_SECONDS
+
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.cooldown_until
+
+    def p95(self) -> Optional[float]:
+        """p95 延迟（秒），样本不足时返回 None。"""
+        with self._lock:
+            if len(self._latencies) < MIN_SAMPLES:
+                return None
+            return float(np.percentile(np.fromiter(self._latencies, dtype=float), 95))
+
+    def snapshot(self) -> Dict:
+        p95 = self.p95()
+        return {
+            "source": self.name,
+            "healthy": self.healthy(),
+            "successes": self.successes,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "wins": self.wins,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "last_error": self.last_error,
+        }
+
+
+class QuoteRouter:
+    """按健康度与 p95 延迟选源并发送对冲请求的行情路由器。"""
+
+    def __init__(
+        self,
+        sources: Dict[str, QuoteSource],
+        hedge_max_delay: float = HEDGE_MAX_DELAY,
+        timeout: float = ROUTE_TIMEOUT,
+    ) -> None:
+        if not sources:
+            raise ValueError("at least one quote source required")
+        self.sources = dict(sources)
+        self.health = {name: SourceHealth(name) for name in self.sources}
+        self.hedge_max_delay = hedge_max_delay
+        self.timeout = timeout
+        # 被对冲淘汰的慢请求继续在后台完成，用于更新统计
+        self._executor = ThreadPoolExecutor(max_workers=4 * len(self.sources), thread_name_prefix="quote-src")
+
+    def ranked_sources(self) -> List[str]:
+        """健康源按 p95 升序，样本不足的源排在有样本的健康源之后，冷却中的源排最后。"""
+
+        def _key(name: str):
+            h = self.health[name]
+            p95 = h.p95()
+            return (not h.healthy(), p95 is None, p95 if p95 is not None else 0.0)
+
+        return sorted(self.sources, key=_key)
+
+    def _hedge_delay(self, name: str) -> float:
+        p95 = self.health[name].p95()
+        if p95 is None:
+            return self.hedge_max_delay
+        return min(max(p95, HEDGE_MIN_DELAY), self.hedge_max_delay)
+
+    def _submit(self, name: str, codes: List[str]) -> Future:
+        health = self.health[name]
+        start = time.monotonic()
+
+        def _call() -> List[Dict]:
+            try:
+                quotes = [normalize_quote(r, name) for r in self.sources[name](codes)]
+                quotes = [q for q in quotes if q["name"] and q["last"] != 0.0]
+                # 有请求却无一条有效行（如限流返回 data: null）视为失败，触发对冲
+                if not quotes:
+                    raise LookupError(f"{name} returned no valid quotes")
+            except Exception as e:
+                health.record_failure(e)
+                raise
+            health.record_success(time.monotonic() - start)
+            return quotes
+
+        return self._executor.submit(_call)
+
+    def get_quotes(self, codes: Sequence[str]) -> List[Dict]:
+        """
+        获取一组代码的统一格式行情。
+        首选源超出延迟预算或失败时依次对冲下一个源，返回第一个成功的结果。
+        """
+        codes = [c for c in codes if c]
+        if not codes:
+            return []
+        order = self.ranked_sources()
+        deadline = time.monotonic() + self.timeout
+        pending: Dict[Future, str] = {self._submit(order[0], codes): order[0]}
+        errors: List[str] = []
+        next_idx = 1
+
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            # 仍有后备源时只等待对冲预算，否则等到整体超时
+            budget = self._hedge_delay(order[next_idx - 1]) if next_idx < len(order) else remaining
+            done, _ = wait(list(pending), timeout=min(budget, remaining), return_when=FIRST_COMPLETED)
+            failed = False
+            for fut in done:
+                name = pending.pop(fut)
+                if fut.exception() is None:
+                    self.health[name].wins += 1
+                    return fut.result()
+                errors.append(f"{name}: {fut.exception()}")
+                failed = True
+            # 超出预算（对冲）或有源失败（故障转移）时启动下一个源
+            if (failed or not done) and next_idx < len(order):
+                pending[self._submit(order[next_idx], codes)] = order[next_idx]
+                next_idx += 1
+        raise RuntimeError("all quote sources failed: " + "; ".join(errors or ["timeout"]))
+
+    def stats(self) -> List[Dict]:
+        """各源健康度与延迟统计，按当前选源顺序排列。"""
+        return [self.health[name].snapshot() for name in self.ranked_sources()]
+
+
+def normalize_quote(row: Dict, source: str) -> Dict:
+    """将不同源的字段统一为 code/name + NORMALIZED_FIELDS，缺失或非有限数值（NaN/inf）记为 0。"""
+    name = row.get("name")
+    item = {"code": str(row.get("code", "")), "name": name if isinstance(name, str) else ""}
+    for field in NORMALIZED_FIELDS:
+        try:
+            value = float(row.get(field) or 0.0)
+        except (TypeError, ValueError):
+            value = 0.0
+        item[field] = value if math.isfinite(value) else 0.0
+    item["source"] = source
+    return item
+
+
+def eastmoney_source(codes: List[str]) -> List[Dict]:
+    """东财直连：逐只并发请求单只实时行情接口（未知代码返回全 0 行，由路由统一过滤）。"""
+    import eastmoney
+
+    with ThreadPoolExecutor(max_workers=min(8, len(codes))) as pool:
+        return list(pool.map(eastmoney.fetch_realtime_quote, codes))
+
+
+def akshare_source(codes: List[str]) -> List[Dict]:
+    """akshare：拉取全市场现货快照后按代码过滤，并映射为东财字段名。"""
+    import akshare as ak
+
+    df = ak.stock_zh_a_spot_em()
+    df = df[df["代码"].isin(codes)]
+    mapping = {
+        "代码": "code",
+        "名称": "name",
+        "最新价": "last",
+        "昨收": "pre_close",
+        "最高": "high",
+        "最低": "low",
+        "今开": "open",
+        "成交量": "volume",
+        "成交额": "amount",
+    }
+    df = df[[c for c in mapping if c in df.columns]].rename(columns=mapping)
+    return df.to_dict(orient="records")
+
+
+def default_router() -> QuoteRouter:
+    """默认路由器：东财直连 + akshare 两个源。"""
+    return QuoteRouter({"eastmoney": eastmoney_source, "akshare": akshare_source})
@@ -0,0 +1,300 @@
+"""
+组合风险分析：基于 a_stock_kline_daily 中的日线计算滚动波动率、beta、收缩协方差与 VaR。
+
+- 一次 SQL 读取整个股票池，复权因子按日期前向填充后向量化相乘，得到 date x code 收盘价矩阵
+- RiskEngine 维护固定窗口的收益率环形缓冲区与一阶/二阶累计量，新 K 线到达时 O(N^2) 增量更新，
+  无需对全窗口重算
+- 协方差采用 Ledoit-Wolf 收缩（目标为等方差对角阵），VaR 同时给出历史法与参数法
+- 基准为指数时使用带前缀的代码（如 sh000300，由 eastmoney.sync_index_kline 同步），
+  6 位代码按个股处理
+- 基准未指定或首次装载时库中无数据，以股票池等权收益作为市场代理计算 beta（benchmark 记为 None，
+  输出为 equal_weight），此后的增量刷新不再改变这一选择
+
+停牌日沿用上一收盘（收益为 0），复牌首日收益相对停牌前收盘计算。
+"""
+
+from __future__ import annotations
+
+import sqlite3
+from statistics import NormalDist
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+import eastmoney
+
+DEFAULT_WINDOW = 60
+TRADING_DAYS = 252
+DEFAULT_ALPHA = 0.95
+
+
+def load_close_matrix(
+    codes: Sequence[str], beg: str = "", last_n: Optional[int] = None
+) -> Tuple[List[str], np.ndarray]:
+    """
+    读取一组代码的后复权收盘价矩阵，返回 (dates, closes)，closes 形状为 len(dates) x len(codes)。
+    后复权与前复权只差每只股票一个常数倍，收益率完全一致，且历史值不受新除权影响。
+    last_n 指定时只读取股票池最近 last_n 个交易日（首次装载用，避免读取全历史）。
+    """
+    codes = list(codes)
+    if not codes:
+        return [], np.empty((0, 0))
+    placeholders = ",".join("?" * len(codes))
+    conn = sqlite3.connect(eastmoney.DB_PATH)
+    try:
+        if last_n:
+            row = conn.execute(
+                f"SELECT MIN(date) FROM (SELECT DISTINCT date FROM a_stock_kline_daily "
+                f"WHERE code IN ({placeholders}) AND date>=? ORDER BY date DESC LIMIT ?);",
+                (*codes, beg, last_n),
+            ).fetchone()
+            beg = max(beg, row[0] or "")
+        bars = pd.read_sql_query(
+            f"SELECT code, date, close FROM a_stock_kline_daily WHERE code IN ({placeholders}) AND date>=?;",
+            conn,
+            params=(*codes, beg),
+        )
+        factors = pd.read_sql_query(
+            f"SELECT code, date, factor FROM a_stock_adj_factor WHERE code IN ({placeholders});",
+            conn,
+            params=tuple(codes),
+        )
+    finally:
+        conn.close()
+    if bars.empty:
+        return [], np.empty((0, len(codes)))
+
+    close = bars.pivot(index="date", columns="code", values="close").reindex(columns=codes).sort_index()
+    if not factors.empty:
+        fac = factors.pivot(index="date", columns="code", values="factor").reindex(columns=codes)
+        all_dates = fac.index.union(close.index)
+        fac = fac.reindex(all_dates).sort_index().ffill().bfill().reindex(close.index).fillna(1.0)
+        close = close * fac
+    return close.index.tolist(), close.to_numpy(dtype=float)
+
+
+def _returns(closes: np.ndarray, prev: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    收盘价矩阵转简单收益率，prev 为窗口前一日收盘（增量更新时衔接用）。
+    停牌日沿用上一收盘（收益为 0），复牌首日收益相对停牌前收盘计算。
+    """
+    if prev is not None:
+        closes = np.vstack([prev, closes])
+    closes = pd.DataFrame(closes).ffill().to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rets = closes[1:] / closes[:-1] - 1.0
+    return np.nan_to_num(rets, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+class RiskEngine:
+    """股票池滚动风险统计，支持逐日增量推入收益率。"""
+
+    def __init__(self, codes: Sequence[str], window: int = DEFAULT_WINDOW) -> None:
+        if window < 2:
+            raise ValueError("window must be >= 2")
+        self.codes = list(codes)
+        self.window = window
+        n = len(self.codes)
+        self._buf = np.zeros((window, n))
+        self._mkt = np.zeros(window)
+        self._pos = 0
+        self.count = 0
+        self._pushes = 0
+        self._s1 = np.zeros(n)
+        self._s2 = np.zeros((n, n))
+        self._m1 = 0.0
+        self._m2 = 0.0
+        self._xm = np.zeros(n)
+        # 增量刷新用：最后一个交易日及其收盘价（含基准列）
+        self.last_date: Optional[str] = None
+        self.last_close: Optional[np.ndarray] = None
+        self.benchmark: Optional[str] = None
+
+    # ---------------- 增量更新 ----------------
+
+    def push(self, rets: np.ndarray, market: Optional[float] = None) -> None:
+        """推入一日的收益率向量；market 为基准收益，缺省取股票池等权平均。"""
+        rets = np.asarray(rets, dtype=float)
+        m = float(rets.mean()) if market is None else float(market)
+        if self.count == self.window:
+            old, old_m = self._buf[self._pos], self._mkt[self._pos]
+            self._s1 -= old
+            self._s2 -= np.outer(old, old)
+            self._m1 -= old_m
+            self._m2 -= old_m * old_m
+            self._xm -= old * old_m
+        else:
+            self.count += 1
+        self._buf[self._pos] = rets
+        self._mkt[self._pos] = m
+        self._pos = (self._pos + 1) % self.window
+        self._s1 += rets
+        self._s2 += np.outer(rets, rets)
+        self._m1 += m
+        self._m2 += m * m
+        self._xm += rets * m
+        self._pushes += 1
+        # 每推入一个完整窗口后从缓冲区重算累计量，抑制浮点误差累积
+        if self._pushes % self.window == 0:
+            self._resync()
+
+    def push_many(self, rets: np.ndarray, market: Optional[np.ndarray] = None) -> None:
+        """按时间顺序批量推入多日收益率（行 = 交易日）。"""
+        for i in range(len(rets)):
+            self.push(rets[i], None if market is None else market[i])
+
+    def _resync(self) -> None:
+        x, m = self._valid()
+        self._s1 = x.sum(axis=0)
+        self._s2 = x.T @ x
+        self._m1 = float(m.sum())
+        self._m2 = float(m @ m)
+        self._xm = x.T @ m
+
+    def _valid(self) -> Tuple[np.ndarray, np.ndarray]:
+        """窗口内有效的收益率行与基准收益（时间顺序不影响统计量）。"""
+        if self.count < self.window:
+            return self._buf[: self.count], self._mkt[: self.count]
+        return self._buf, self._mkt
+
+    # ---------------- 风险指标 ----------------
+
+    def _require(self) -> int:
+        if self.count < 2:
+            raise ValueError("not enough bars in window")
+        return self.count
+
+    def mean(self) -> np.ndarray:
+        return self._s1 / self._require()
+
+    def covariance(self) -> np.ndarray:
+        """样本协方差（无偏），由累计量直接得到。"""
+        n = self._require()
+        mu = self._s1 / n
+        return (self._s2 / n - np.outer(mu, mu)) * n / (n - 1)
+
+    def volatility(self, annualize: bool = True) -> np.ndarray:
+        var = np.clip(np.diag(self.covariance()), 0.0, None)
+        vol = np.sqrt(var)
+        return vol * np.sqrt(TRADING_DAYS) if annualize else vol
+
+    def beta(self) -> np.ndarray:
+        n = self._require()
+        mu, mm = self._s1 / n, self._m1 / n
+        var_m = self._m2 / n - mm * mm
+        if var_m <= 0:
+            return np.full(len(self.codes), np.nan)
+        return (self._xm / n - mu * mm) / var_m
+
+    def shrunk_covariance(self) -> Tuple[np.ndarray, float]:
+        """
+        Ledoit-Wolf 收缩协方差，目标为 mu*I（mu 为平均方差），返回 (协方差, 收缩强度)。
+        pi 项由缓冲区按 mean(|x_t|^4) - |S|_F^2 的恒等式计算，复杂度 O(T*N + N^2)。
+        """
+        n = self._require()
+        x, _ = self._valid()
+        xc = x - self._s1 / n
+        sample = self._s2 / n - np.outer(self._s1 / n, self._s1 / n)
+        p = sample.shape[0]
+        mu = np.trace(sample) / p
+        target = mu * np.eye(p)
+        d2 = float(((sample - target) ** 2).sum())
+        row_sq = (xc * xc).sum(axis=1)
+        pi = float((row_sq * row_sq).mean() - (sample * sample).sum())
+        b2 = min(max(pi / n, 0.0), d2)
+        shrink = b2 / d2 if d2 > 0 else 1.0
+        return shrink * target + (1.0 - shrink) * sample, shrink
+
+    def value_at_risk(
+        self, weights: Optional[np.ndarray] = None, alpha: float = DEFAULT_ALPHA
+    ) -> Dict[str, object]:
+        """
+        1 日 VaR（正数表示损失比例）：个股与组合分别给出历史法与参数法。
+        weights 缺省为等权；参数法使用收缩协方差。
+        """
+        n = self._require()
+        x, _ = self._valid()
+        p = len(self.codes)
+        w = np.full(p, 1.0 / p) if weights is None else np.asarray(weights, dtype=float)
+        z = NormalDist().inv_cdf(alpha)
+        mu = self._s1 / n
+        cov, shrink = self.shrunk_covariance()
+
+        port = x @ w
+        port_sigma = float(np.sqrt(max(w @ cov @ w, 0.0)))
+        return {
+            "alpha": alpha,
+            "shrinkage": shrink,
+            "var_hist": (-np.quantile(x, 1.0 - alpha, axis=0)).tolist(),
+            "var_param": (z * np.sqrt(np.clip(np.diag(cov), 0.0, None)) - mu).tolist(),
+            "portfolio": {
+                "var_hist": float(-np.quantile(port, 1.0 - alpha)),
+                "var_param": float(z * port_sigma - w @ mu),
+                "volatility": port_sigma * float(np.sqrt(TRADING_DAYS)),
+            },
+        }
+
+    def summary(self, weights: Optional[np.ndarray] = None, alpha: float = DEFAULT_ALPHA, with_cov: bool = False) -> Dict:
+        """接口输出：逐股波动率/beta/VaR 与组合 VaR，可选附带收缩协方差矩阵。"""
+        var = self.value_at_risk(weights, alpha)
+        result = {
+            "as_of": self.last_date,
+            "window": self.window,
+            "bars": self.count,
+            "benchmark": self.benchmark or "equal_weight",
+            "codes": self.codes,
+            "volatility": self.volatility().tolist(),
+            "beta": self.beta().tolist(),
+            **var,
+        }
+        if with_cov:
+            result["covariance"] = self.shrunk_covariance()[0].tolist()
+        return result
+
+    # ---------------- 数据库装载与刷新 ----------------
+
+    @classmethod
+    def from_db(
+        cls, codes: Sequence[str], window: int = DEFAULT_WINDOW, benchmark: Optional[str] = None
+    ) -> "RiskEngine":
+        """从库中装载最近 window 个交易日初始化引擎。"""
+        engine = cls(codes, window)
+        engine.benchmark = benchmark
+        engine.refresh()
+        return engine
+
+    def refresh(self) -> int:
+        """读取 last_date 之后的新 K 线并增量推入，返回新增交易日数。"""
+        cols = self.codes + ([self.benchmark] if self.benchmark else [])
+        if self.last_close is None:
+            # 首次装载只读取最后 window+1 个交易日
+            dates, closes = load_close_matrix(cols, last_n=self.window + 1)
+            if not dates:
+                return 0
+            if self.benchmark and not np.any(closes[:, -1] > 0):
+                # 基准无数据时退回等权代理，并在此一次性确定，后续刷新不再读取基准
+                eastmoney._log(f"基准 {self.benchmark} 无 K 线数据，beta 改用等权代理")
+                self.benchmark = None
+                closes = closes[:, :-1]
+            rets = _returns(closes)
+            new_dates = dates[1:]
+        else:
+            dates, closes = load_close_matrix(cols, beg=self.last_date)
+            if dates and dates[0] == self.last_date:
+                dates, closes = dates[1:], closes[1:]
+            if not dates:
+                return 0
+            rets = _returns(closes, prev=self.last_close)
+            new_dates = dates
+        if self.benchmark:
+            market = rets[:, -1]
+            rets = rets[:, :-1]
+        else:
+            market = None
+        self.push_many(rets, market)
+        self.last_date = dates[-1]
+        # 保留每列最后一个有效收盘，停牌中的股票复牌时仍能衔接
+        filled = pd.DataFrame(closes).ffill().to_numpy()[-1]
+        self.last_close = filled if self.last_close is None else np.where(np.isnan(filled), self.last_close, filled)
+        return len(new_dates)
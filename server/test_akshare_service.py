@@ -1,13 +1,16 @@
 import unittest
 from unittest.mock import patch, MagicMock
 import pandas as pd
+import gzip
 import json
+import akshare_service
 from akshare_service import app
 
 class TestAkshareService(unittest.TestCase):
     def setUp(self):
         self.app = app.test_client()
         self.app.testing = True
+        akshare_service._history_cache.clear()
 
     @patch('akshare.stock_zh_a_hist')
     def test_history_success(self, mock_hist):
@@ -45,6 +48,171 @@ class TestAkshareService(unittest.TestCase):
         self.assertTrue(data['success'])
         self.assertEqual(data['data'], [])
 
+    @patch('akshare.stock_zh_a_hist')
+    def test_history_cached_per_symbol_and_adjust(self, mock_hist):
+        mock_hist.return_value = pd.DataFrame({
+            "日期": ["2023-01-01"], "开盘": [10.0], "收盘": [11.0], "最高": [12.0], "最低": [9.0],
+            "成交量": [1000], "成交额": [10000], "振幅": [3.0], "涨跌幅": [10.0], "涨跌额": [1.0], "换手率": [1.0]
+        })
+        self.app.get('/history?symbol=600000&days=5')
+        self.app.get('/history?symbol=600000&days=10')
+        self.assertEqual(mock_hist.call_count, 1)
+        self.app.get('/history?symbol=600000&adjust=hfq')
+        self.assertEqual(mock_hist.call_count, 2)
+        self.assertEqual(mock_hist.call_args.kwargs["adjust"], "hfq")
+
+        stats = json.loads(self.app.get('/history/cache').data)['data']
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 2)
+
+    @patch('akshare.stock_zh_a_hist')
+    def test_history_columns_format(self, mock_hist):
+        mock_hist.return_value = pd.DataFrame({
+            "日期": ["2023-01-01", "2023-01-02"], "开盘": [10.0, 11.0], "收盘": [11.0, 12.0], "最高": [12.0, 13.0],
+            "最低": [9.0, 10.0], "成交量": [1000, 2000], "成交额": [10000, 24000], "振幅": [3.0, 3.0],
+            "涨跌幅": [10.0, 9.0], "涨跌额": [1.0, 1.0], "换手率": [1.0, 1.2]
+        })
+        response = self.app.get('/history?symbol=600000&format=columns')
+        data = json.loads(response.data)
+        self.assertEqual(data['format'], 'columns')
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(data['data']['date'], ["2023-01-01", "2023-01-02"])
+        self.assertEqual(data['data']['close'], [11.0, 12.0])
+
+        # Accept 头协商等价于 ?format=columns
+        response = self.app.get('/history?symbol=600000', headers={"Accept": "application/vnd.alphatrader.columns+json"})
+        self.assertEqual(json.loads(response.data)['data']['volume'], [1000.0, 2000.0])
+        self.assertEqual(response.headers["Vary"], "Accept, Accept-Encoding")
+        self.assertNotIn("Content-Encoding", response.headers)
+
+    @patch('akshare.stock_zh_a_hist')
+    def test_history_dates_identical_across_formats(self, mock_hist):
+        import datetime
+        mock_hist.return_value = pd.DataFrame({
+            "日期": [datetime.date(2023, 1, 3), datetime.date(2023, 1, 4)], "开盘": [10.0, 11.0], "收盘": [11.0, 12.0],
+            "最高": [12.0, 13.0], "最低": [9.0, 10.0], "成交量": [1000, 2000], "成交额": [10000, 24000],
+            "振幅": [3.0, 3.0], "涨跌幅": [10.0, 9.0], "涨跌额": [1.0, 1.0], "换手率": [1.0, 1.2]
+        })
+        rows = json.loads(self.app.get('/history?symbol=600000').data)['data']
+        columns = json.loads(self.app.get('/history?symbol=600000&format=columns').data)['data']
+        self.assertEqual([r['date'] for r in rows], ["2023-01-03", "2023-01-04"])
+        self.assertEqual(columns['date'], ["2023-01-03", "2023-01-04"])
+
+    @patch('akshare.stock_zh_a_spot_em')
+    def test_master_columns_gzip(self, mock_spot):
+        n = 200
+        mock_spot.return_value = pd.DataFrame({
+            "代码": [f"{600000 + i}" if i % 2 else f"{i:06d}" for i in range(n)],
+            "名称": ["股票"] * n,
+            "最新价": [10.0] * (n - 1) + [float("nan")],
+            "涨跌幅": [1.0] * n,
+            "成交量": [100] * n,
+        })
+        response = self.app.get('/master?format=columns', headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers.get("Content-Encoding"), "gzip")
+        data = json.loads(gzip.decompress(response.data))
+        self.assertEqual(data['count'], n)
+        self.assertEqual(data['data']['market_id'][:2], [0, 1])
+        self.assertIsNone(data['data']['price'][-1])
+
+        rows = json.loads(self.app.get('/master').data)['data']
+        self.assertEqual(rows[1], {"symbol": "600001", "name": "股票", "price": 10.0, "change": 1.0, "volume": 100.0, "market_id": 1})
+
+    def test_history_bad_adjust(self):
+        response = self.app.get('/history?symbol=600000&adjust=foo')
+        self.assertEqual(response.status_code, 400)
+
+    def test_risk_validation(self):
+        self.assertEqual(self.app.get('/risk').status_code, 400)
+        response = self.app.get('/risk?symbols=000001,600000&weights=1')
+        self.assertEqual(response.status_code, 400)
+
+    def test_quote_book_reattached_after_refresher_restart(self):
+        import uuid
+        import quote_book
+        name = f"qb_svc_{uuid.uuid4().hex[:8]}"
+        frame = pd.DataFrame([{"code": "000001", "name": "平安银行", "last": 12.0}])
+        writer = quote_book.QuoteBook.create(name, capacity=4)
+        writer.write_frame(frame)
+        try:
+            with patch.dict('os.environ', {"QUOTE_BOOK_NAME": name}), \
+                    patch.object(akshare_service, "_quote_book", None):
+                first = akshare_service._get_quote_book()
+                self.assertAlmostEqual(first.get("000001")["last"], 12.0)
+
+                writer.close()
+                writer = quote_book.QuoteBook.create(name, capacity=4)
+                writer.write_frame(frame.assign(last=12.5))
+                book = akshare_service._get_quote_book()
+                self.assertNotEqual(book.generation, first.generation)
+                self.assertAlmostEqual(book.get("000001")["last"], 12.5)
+
+                # 刷新进程退出且未重启：回退到多源路由
+                writer.close()
+                writer = None
+                self.assertIsNone(akshare_service._get_quote_book())
+        finally:
+            if writer is not None:
+                writer.close()
+
+    def test_risk_engine_cache_is_bounded(self):
+        engine = MagicMock()
+        engine.summary.return_value = {}
+        with patch.object(akshare_service, "RISK_ENGINE_CACHE_SIZE", 2), \
+                patch.object(akshare_service, "_risk_engines", akshare_service.OrderedDict()), \
+                patch("risk_engine.RiskEngine.from_db", return_value=engine) as from_db:
+            for symbols in ("000001", "000002", "000001", "000003"):
+                self.assertEqual(self.app.get(f'/risk?symbols={symbols}').status_code, 200)
+            self.assertEqual(from_db.call_count, 3)
+            self.assertEqual([k[0] for k in akshare_service._risk_engines], [("000001",), ("000003",)])
+
+    def test_risk_database_error_is_json(self):
+        import sqlite3
+        with patch.object(akshare_service, "_risk_engines", akshare_service.OrderedDict()), \
+                patch("risk_engine.RiskEngine.from_db", side_effect=sqlite3.OperationalError("no such table")):
+            response = self.app.get('/risk?symbols=000001')
+        self.assertEqual(response.status_code, 503)
+        data = json.loads(response.data)
+        self.assertFalse(data["success"])
+        self.assertIn("no such table", data["error"])
+
+    def test_risk_slow_universe_does_not_block_others(self):
+        import threading
+        release = threading.Event()
+        engine = MagicMock()
+        engine.summary.return_value = {}
+
+        def _from_db(symbols, window, benchmark):
+            if symbols == ["000001"]:
+                release.wait(2)
+            return engine
+
+        with patch.object(akshare_service, "_risk_engines", akshare_service.OrderedDict()), \
+                patch("risk_engine.RiskEngine.from_db", side_effect=_from_db):
+            slow = threading.Thread(target=lambda: app.test_client().get('/risk?symbols=000001'))
+            slow.start()
+            try:
+                # 慢装载进行中，其他股票池的请求仍能立即返回
+                self.assertEqual(self.app.get('/risk?symbols=600000').status_code, 200)
+                self.assertTrue(slow.is_alive())
+            finally:
+                release.set()
+                slow.join()
+
+    def test_quotes_fall_back_to_router_on_book_timeout(self):
+        book = MagicMock()
+        book.updated_ms = 1
+        book.get_many.side_effect = TimeoutError("writer stuck")
+        router = MagicMock()
+        router.get_quotes.return_value = [{"code": "000001", "name": "平安银行", "last": 12.0, "pre_close": 11.5,
+                                           "high": 12.2, "low": 11.4, "open": 11.6, "volume": 1.0, "amount": 2.0,
+                                           "source": "akshare"}]
+        with patch.object(akshare_service, "_get_quote_book", return_value=book), \
+                patch.object(akshare_service, "_get_quote_router", return_value=router):
+            response = self.app.get('/quotes?symbols=000001')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)["data"][0]["source"], "akshare")
+
     def test_history_no_symbol(self):
         response = self.app.get('/history')
         self.assertEqual(response.status_code, 400)
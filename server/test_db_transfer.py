@@ -0,0 +1,172 @@
+import gzip
+import json
+import os
+import sqlite3
+import sys
+import unittest
+
+import pandas as pd
+
+CURRENT_DIR = os.path.dirname(__file__)
+sys.path.insert(0, CURRENT_DIR)
+import db_transfer  # noqa: E402
+import eastmoney  # noqa: E402
+
+
+class DbTransferTestCase(unittest.TestCase):
+    """验证分块导出/导入的往返一致性、索引重建与校验失败处理。"""
+
+    def setUp(self) -> None:
+        self.src = os.path.join(CURRENT_DIR, "test_transfer_src.db")
+        self.dst = os.path.join(CURRENT_DIR, "test_transfer_dst.db")
+        self.dump = os.path.join(CURRENT_DIR, "test_transfer.atx.gz")
+        self._cleanup()
+        eastmoney.DB_PATH = self.src
+        eastmoney.init_db()
+        eastmoney.save_master_to_db(
+            pd.DataFrame(
+                [{"code": "000001", "market_id": 0, "name": "平安银行", "last": 12.0, "chg_pct": 0.0, "chg": 0.0,
+                  "volume": 100, "amount": 200.5, "high": 13.0, "low": 11.0, "open": 12.0, "pre_close": 12.0,
+                  "total_mv": 1.0, "float_mv": 1.0, "pe_dynamic": None, "pb": 1.0}]
+            )
+        )
+        dates = pd.bdate_range("2020-01-01", periods=250).strftime("%Y-%m-%d")
+        for code in ("000001", "600000"):
+            eastmoney.save_kline_to_db(
+                code,
+                pd.DataFrame({"date": dates, "open": 1.0, "close": 1.25, "high": 1.5, "low": 0.5,
+                              "volume": 1000, "amount": 1250.0}),
+            )
+        eastmoney.save_adj_factors_to_db("000001", pd.DataFrame({"date": [dates[0]], "factor": [1.0]}))
+
+    def tearDown(self) -> None:
+        self._cleanup()
+
+    def _cleanup(self):
+        for path in (self.src, self.dst, self.dump):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _dump_table(self, path, sql):
+        conn = sqlite3.connect(path)
+        try:
+            return conn.execute(sql).fetchall()
+        finally:
+            conn.close()
+
+    def _rewrite_manifest(self, edit):
+        with gzip.open(self.dump, "rb") as fp:
+            manifest = json.loads(fp.readline())
+            rest = fp.read()
+        edit({t["name"]: t for t in manifest["tables"]})
+        with gzip.open(self.dump, "wb") as fp:
+            fp.write(json.dumps(manifest, ensure_ascii=False).encode("utf-8") + b"\n" + rest)
+
+    def _assert_target_untouched(self):
+        for table in db_transfer.DEFAULT_TABLES:
+            self.assertEqual(self._dump_table(self.dst, f"SELECT COUNT(*) FROM {table};"), [(0,)])
+        indexes = self._dump_table(self.dst, "SELECT name FROM sqlite_master WHERE type='index' AND tbl_name='a_stock_kline_daily';")
+        self.assertIn(("idx_kline_code_date",), indexes)
+
+    def test_roundtrip_into_fresh_db(self):
+        totals = db_transfer.export_db(self.src, self.dump, chunk_rows=64)
+        self.assertEqual(totals, {"a_stock_master": 1, "a_stock_kline_daily": 500, "a_stock_adj_factor": 1})
+        self.assertEqual(db_transfer.verify_export(self.dump), totals)
+
+        written = db_transfer.import_db(self.dst, self.dump)
+        self.assertEqual(written, totals)
+        for sql in (
+            "SELECT * FROM a_stock_master;",
+            "SELECT code, date, open, close, high, low, volume, amount FROM a_stock_kline_daily ORDER BY code, date;",
+            "SELECT * FROM a_stock_adj_factor ORDER BY code, date;",
+        ):
+            self.assertEqual(self._dump_table(self.src, sql), self._dump_table(self.dst, sql))
+        indexes = self._dump_table(self.dst, "SELECT name FROM sqlite_master WHERE type='index' AND tbl_name='a_stock_kline_daily';")
+        self.assertIn(("idx_kline_code_date",), indexes)
+
+    def test_import_into_populated_db_upserts(self):
+        db_transfer.export_db(self.src, self.dump, chunk_rows=100)
+        db_transfer.import_db(self.dst, self.dump)
+        db_transfer.import_db(self.dst, self.dump)
+        count = self._dump_table(self.dst, "SELECT COUNT(*) FROM a_stock_kline_daily;")[0][0]
+        self.assertEqual(count, 500)
+
+    def test_corrupted_chunk_rejected(self):
+        db_transfer.export_db(self.src, self.dump, chunk_rows=100)
+        with gzip.open(self.dump, "rb") as fp:
+            data = fp.read()
+        # 破坏最后一个 K 线分块，此前的分块均完好
+        head, _, tail = data.rpartition(b"1.25")
+        with gzip.open(self.dump, "wb") as fp:
+            fp.write(head + b"1.26" + tail)
+        with self.assertRaises(ValueError):
+            db_transfer.verify_export(self.dump)
+
+        eastmoney.DB_PATH = self.dst
+        eastmoney.init_db()
+        with self.assertRaises(ValueError):
+            db_transfer.import_db(self.dst, self.dump)
+        # 导入前校验失败，目标库不写入任何分块，索引保持原样
+        self._assert_target_untouched()
+
+    def test_untrusted_manifest_rejected(self):
+        db_transfer.export_db(self.src, self.dump, chunk_rows=100)
+        with gzip.open(self.dump, "rb") as fp:
+            original = fp.read()
+        edits = [
+            lambda t: t["a_stock_master"].update(name="sqlite_master"),
+            lambda t: t["a_stock_master"].update(sql="DROP TABLE a_stock_kline_daily"),
+            lambda t: t["a_stock_master"].update(sql="CREATE TABLE a_stock_master (code TEXT); ATTACH 'x.db' AS x"),
+            lambda t: t["a_stock_adj_factor"].update(sql=t["a_stock_master"]["sql"]),
+            lambda t: t["a_stock_kline_daily"]["indexes"].append("CREATE INDEX idx_evil ON a_stock_master(code)"),
+            lambda t: t["a_stock_kline_daily"]["columns"].append("code) SELECT 1; --"),
+        ]
+        eastmoney.DB_PATH = self.dst
+        eastmoney.init_db()
+        for edit in edits:
+            with gzip.open(self.dump, "wb") as fp:
+                fp.write(original)
+            self._rewrite_manifest(edit)
+            with self.assertRaises(ValueError):
+                db_transfer.verify_export(self.dump)
+            with self.assertRaises(ValueError):
+                db_transfer.import_db(self.dst, self.dump)
+            self._assert_target_untouched()
+
+    def test_columns_missing_in_target_rejected(self):
+        db_transfer.export_db(self.src, self.dump, chunk_rows=100)
+        eastmoney.DB_PATH = self.dst
+        eastmoney.init_db()
+        conn = sqlite3.connect(self.dst)
+        try:
+            conn.execute("ALTER TABLE a_stock_adj_factor RENAME COLUMN factor TO factor_old;")
+        finally:
+            conn.close()
+        with self.assertRaises(ValueError):
+            db_transfer.import_db(self.dst, self.dump)
+        self._assert_target_untouched()
+
+    def test_target_only_indexes_survive_import(self):
+        conn = sqlite3.connect(self.src)
+        try:
+            conn.execute("DROP INDEX idx_kline_code_date;")
+            conn.execute("CREATE INDEX idx_src_date ON a_stock_kline_daily(date);")
+        finally:
+            conn.close()
+        db_transfer.export_db(self.src, self.dump, chunk_rows=100)
+
+        eastmoney.DB_PATH = self.dst
+        eastmoney.init_db()
+        conn = sqlite3.connect(self.dst)
+        try:
+            conn.execute("CREATE INDEX idx_extra ON a_stock_kline_daily(code);")
+        finally:
+            conn.close()
+        db_transfer.import_db(self.dst, self.dump)
+        indexes = {r[0] for r in self._dump_table(
+            self.dst, "SELECT name FROM sqlite_master WHERE type='index' AND tbl_name='a_stock_kline_daily';"
+        )}
+        self.assertTrue({"idx_kline_code_date", "idx_extra", "idx_src_date"} <= indexes)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -6,6 +6,7 @@ import unittest
 from datetime import datetime, timezone
 from unittest import mock
 
+import numpy as np
 import pandas as pd
 
 # 将 server 目录加入路径，便于直接导入 eastmoney 模块
@@ -14,6 +15,75 @@ sys.path.insert(0, CURRENT_DIR)
 import eastmoney  # noqa: E402
 
 
+class _DummyResp:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def raise_for_status(self):
+        return None
+
+    def json(self):
+        return self.payload
+
+
+class _AdjustedKlines:
+    """
+    生成不复权日线及东财风格前复权日线（逐次叠加 (P - cash) / (1 + ratio)），
+    events 为 {交易日下标: (每股派息, 每股送转)}。
+    """
+
+    def __init__(self, events, periods: int, start: float = 2.0) -> None:
+        self.events = events
+        self.dates = pd.bdate_range("2023-01-02", periods=periods).strftime("%Y-%m-%d").tolist()
+        rng = np.random.default_rng(3)
+        self.closes, self.pre_closes = [], []
+        # 持续上涨后派息，使早期前复权价可能为负
+        prev = start
+        for t in range(periods):
+            pre = prev
+            if t in events:
+                cash, ratio = events[t]
+                pre = round((prev - cash) / (1 + ratio), 2)
+            close = round(pre * (1 + rng.normal(0.03, 0.01)), 2)
+            self.closes.append(close)
+            self.pre_closes.append(pre)
+            prev = close
+
+    def _qfq(self, price: float, t: int, upto: int) -> float:
+        for e in sorted(self.events):
+            if t < e <= upto:
+                price = (price - self.events[e][0]) / (1 + self.events[e][1])
+        return round(price, 2)
+
+    def _line(self, t: int, adjust: bool, upto: int) -> str:
+        close = self.closes[t]
+        o, h, l = round(close * 0.99, 2), round(close * 1.02, 2), round(close * 0.97, 2)
+        if adjust:
+            o, close, h, l = (self._qfq(v, t, upto) for v in (o, close, h, l))
+        chg = round(self.closes[t] - self.pre_closes[t], 2)
+        return f"{self.dates[t]},{o},{close},{h},{l},1000,10000,1.0,1.0,{chg},1.0"
+
+    def responder(self, upto=None):
+        """模拟截至第 upto 个交易日的 K 线接口，按 fqt 与 beg 参数返回。"""
+        upto = len(self.dates) - 1 if upto is None else upto
+
+        def _get(url, params, **kwargs):
+            beg = params["beg"]
+            lines = [
+                self._line(t, params["fqt"] == "1", upto)
+                for t in range(upto + 1)
+                if beg == "0" or self.dates[t].replace("-", "") >= beg
+            ]
+            return _DummyResp({"data": {"klines": lines}})
+
+        return _get
+
+    def expected_qfq(self) -> pd.DataFrame:
+        rows = [line.split(",")[:5] for line in self.responder()(None, {"beg": "0", "fqt": "1"}).payload["data"]["klines"]]
+        df = pd.DataFrame(rows, columns=["date", "open", "close", "high", "low"])
+        return df.astype({c: float for c in ("open", "close", "high", "low")})
+
+
 class EastMoneyTestCase(unittest.TestCase):
     """验证核心解析与入库逻辑的最小单元测试。"""
 
@@ -34,10 +104,32 @@ class EastMoneyTestCase(unittest.TestCase):
     def test_code_to_secid(self):
         self.assertEqual(eastmoney.code_to_secid("600000"), "1.600000")
         self.assertEqual(eastmoney.code_to_secid("000001"), "0.000001")
+        # 指数带市场前缀，与同号股票区分
+        self.assertEqual(eastmoney.code_to_secid("sh000300"), "1.000300")
+        self.assertEqual(eastmoney.code_to_secid("sz399001"), "0.399001")
+
+    def test_sync_index_kline(self):
+        first = {"data": {"klines": ["2024-01-02,3400.1,3410.5,3420.0,3390.0,1e8,1e11,1.0,0.3,10.2,0.5"]}}
+        second = {"data": {"klines": [
+            "2024-01-02,3400.1,3410.5,3420.0,3390.0,1e8,1e11,1.0,0.3,10.2,0.5",
+            "2024-01-03,3410.0,3380.2,3415.0,3370.0,1e8,1e11,1.0,-0.9,-30.3,0.5",
+        ]}}
+        with mock.patch("eastmoney.requests.get", return_value=_DummyResp(first)) as get:
+            self.assertEqual(eastmoney.sync_index_kline("sh000300"), 1)
+            self.assertEqual(get.call_args.kwargs["params"]["secid"], "1.000300")
+        with mock.patch("eastmoney.requests.get", return_value=_DummyResp(second)) as get:
+            self.assertEqual(eastmoney.sync_index_kline("sh000300"), 1)
+            self.assertEqual(get.call_args.kwargs["params"]["beg"], "20240102")
+        closes = eastmoney.load_kline("sh000300", adjust="qfq")["close"].tolist()
+        self.assertEqual(closes, [3410.5, 3380.2])
+        # 股票 000300 不受影响
+        self.assertTrue(eastmoney.load_kline("000300", adjust="").empty)
+        with self.assertRaises(ValueError):
+            eastmoney.sync_index_kline("000300")
 
     def test_fetch_realtime_quote_parse(self):
-        # 模拟东财实时行情返回，确保 /100 还原
-        sample_resp = {"data": {"f57": "000001", "f58": "平安银行", "f43": 1234, "f60": 1200, "f44": 1250, "f45": 1190, "f46": 1210, "f47": 987654, "f71": 1220, "f168": 1.5, "f164": 0.8}}
+        # 模拟东财实时行情返回（fltt=2：价格为以元为单位的小数，不再缩放）
+        sample_resp = {"data": {"f57": "000001", "f58": "平安银行", "f43": 12.34, "f60": 12.0, "f44": 12.5, "f45": 11.9, "f46": 12.1, "f47": 987654, "f71": 12.2, "f168": 1.5, "f164": 0.8}}
 
         class DummyResp:
             def __init__(self, payload):
@@ -158,6 +250,154 @@ class EastMoneyTestCase(unittest.TestCase):
         self.assertAlmostEqual(row[2], 1.0)
         self.assertAlmostEqual(row[3], 2.0)
 
+    def test_adj_factor_and_load_kline(self):
+        # 第三日除权：上日收盘 11.0，交易所前收 10.0，后复权因子变为 1.1
+        df_raw = pd.DataFrame(
+            [
+                {"date": "2024-01-02", "open": 10.0, "close": 10.5, "high": 10.6, "low": 9.9, "volume": 100, "amount": 1000, "pre_close": 10.0},
+                {"date": "2024-01-03", "open": 10.5, "close": 11.0, "high": 11.1, "low": 10.4, "volume": 100, "amount": 1000, "pre_close": 10.5},
+                {"date": "2024-01-04", "open": 10.1, "close": 10.2, "high": 10.3, "low": 10.0, "volume": 100, "amount": 1000, "pre_close": 10.0},
+            ]
+        )
+        factors = eastmoney.compute_adj_factors(df_raw)
+        self.assertEqual(list(factors["date"]), ["2024-01-02", "2024-01-04"])
+        self.assertAlmostEqual(factors["factor"].iloc[-1], 1.1)
+
+        eastmoney.save_kline_to_db("000001", df_raw)
+        eastmoney.save_adj_factors_to_db("000001", factors)
+        raw = eastmoney.load_kline("000001", adjust="")
+        qfq = eastmoney.load_kline("000001", adjust="qfq")
+        hfq = eastmoney.load_kline("000001", adjust="hfq")
+        self.assertAlmostEqual(raw["close"].iloc[1], 11.0)
+        self.assertAlmostEqual(qfq["close"].iloc[1], 10.0)
+        self.assertAlmostEqual(qfq["close"].iloc[2], 10.2)
+        self.assertAlmostEqual(hfq["close"].iloc[2], 11.22)
+        self.assertEqual(qfq["volume"].iloc[1], 100)
+
+    def test_sync_kline_raw_incremental(self):
+        class DummyResp:
+            def __init__(self, payload):
+                self.payload = payload
+
+            def raise_for_status(self):
+                return None
+
+            def json(self):
+                return self.payload
+
+        first = {"data": {"klines": [
+            "2024-01-02,10.0,10.5,10.6,9.9,100,1000,1.0,5.0,0.5,1.0",
+            "2024-01-03,10.5,11.0,11.1,10.4,100,1000,1.0,4.76,0.5,1.0",
+        ]}}
+        # 增量拉取包含已存的最后一天，且 01-04 每股派息 1 元除权
+        second = {"data": {"klines": [
+            "2024-01-03,10.5,11.0,11.1,10.4,100,1000,1.0,4.76,0.5,1.0",
+            "2024-01-04,10.1,10.2,10.3,10.0,100,1000,1.0,2.0,0.2,1.0",
+        ]}}
+        second_qfq = {"data": {"klines": [
+            "2024-01-02,9.0,9.5,9.6,8.9,100,1000,1.0,5.0,0.5,1.0",
+            "2024-01-03,9.5,10.0,10.1,9.4,100,1000,1.0,4.76,0.5,1.0",
+            "2024-01-04,10.1,10.2,10.3,10.0,100,1000,1.0,2.0,0.2,1.0",
+        ]}}
+        with mock.patch("eastmoney.requests.get", return_value=DummyResp(first)) as get:
+            self.assertEqual(eastmoney.sync_kline_raw("000001"), 2)
+            self.assertEqual(get.call_count, 1)
+            self.assertEqual(get.call_args.kwargs["params"]["fqt"], "0")
+
+        def _get(url, params, **kwargs):
+            return DummyResp(second_qfq if params["fqt"] == "1" else second)
+
+        with mock.patch("eastmoney.requests.get", side_effect=_get) as get:
+            self.assertEqual(eastmoney.sync_kline_raw("000001"), 1)
+            raw_params, qfq_params = (c.kwargs["params"] for c in get.call_args_list)
+            self.assertEqual(raw_params["beg"], "20240103")
+            self.assertEqual(qfq_params["beg"], "20240102")
+
+        qfq = eastmoney.load_kline("000001", adjust="qfq")
+        self.assertEqual(len(qfq), 3)
+        self.assertAlmostEqual(qfq["close"].iloc[0], 9.5)
+        self.assertAlmostEqual(qfq["close"].iloc[1], 10.0)
+        self.assertAlmostEqual(qfq["close"].iloc[2], 10.2)
+
+    def test_qfq_matches_eastmoney_additive_adjustment(self):
+        # 东财前复权逐次叠加 (P - cash) / (1 + ratio)：派息、10 送 5 派 2、大额派息，早期前复权价为负
+        events = {15: (0.3, 0.0), 30: (0.2, 0.5), 45: (2.5, 0.0)}
+        fixture = _AdjustedKlines(events, periods=60)
+        with mock.patch("eastmoney.requests.get", side_effect=fixture.responder()):
+            eastmoney.sync_kline_raw("000001")
+
+        qfq = eastmoney.load_kline("000001", adjust="qfq")
+        self._assert_matches_qfq(qfq, fixture.expected_qfq())
+        self.assertLess(qfq["close"].iloc[0], 0)
+
+        conn = sqlite3.connect(self.tmp_db)
+        try:
+            terms = conn.execute(
+                "SELECT date, cash, ratio FROM a_stock_adj_factor WHERE code='000001' ORDER BY date;"
+            ).fetchall()
+        finally:
+            conn.close()
+        self.assertEqual([t[0] for t in terms[1:]], [fixture.dates[e] for e in sorted(events)])
+        for (_, cash, ratio), e in zip(terms[1:], sorted(events)):
+            self.assertAlmostEqual(cash, events[e][0], places=2)
+            self.assertAlmostEqual(ratio, events[e][1], places=2)
+
+    def test_incremental_fit_ignores_bars_before_previous_ex_date(self):
+        # 已存除权 t=50，同步到 t=55；t=60 再次除权，回看窗口内同时包含两次除权
+        events = {50: (0.5, 0.3), 60: (0.4, 0.0)}
+        fixture = _AdjustedKlines(events, periods=66)
+        with mock.patch("eastmoney.requests.get", side_effect=fixture.responder(upto=55)):
+            eastmoney.sync_kline_raw("000001")
+        with mock.patch("eastmoney.requests.get", side_effect=fixture.responder()) as get:
+            self.assertEqual(eastmoney.sync_kline_raw("000001"), 10)
+            # 前复权只回看到上一个除权日
+            self.assertEqual(get.call_args_list[-1].kwargs["params"]["beg"], fixture.dates[50].replace("-", ""))
+
+        self._assert_matches_qfq(eastmoney.load_kline("000001", adjust="qfq"), fixture.expected_qfq())
+        conn = sqlite3.connect(self.tmp_db)
+        try:
+            cash, ratio = conn.execute(
+                "SELECT cash, ratio FROM a_stock_adj_factor WHERE code='000001' AND date=?;", (fixture.dates[60],)
+            ).fetchone()
+        finally:
+            conn.close()
+        self.assertAlmostEqual(cash, 0.4, places=2)
+        self.assertAlmostEqual(ratio, 0.0, places=2)
+
+    def _assert_matches_qfq(self, qfq: pd.DataFrame, expected: pd.DataFrame) -> None:
+        self.assertEqual(list(qfq["date"]), list(expected["date"]))
+        for col in ("open", "close", "high", "low"):
+            diff = np.abs(qfq[col].to_numpy() - expected[col].to_numpy())
+            self.assertLessEqual(diff.max(), 0.0101, col)
+
+    def test_sync_kline_raw_legacy_rebuild(self):
+        legacy = pd.DataFrame([{"date": "2024-01-02", "open": 9.0, "close": 9.5, "high": 9.6, "low": 8.9,
+                                "volume": 100, "amount": 1000}])
+        eastmoney.save_kline_to_db("000001", legacy)
+
+        # 拉取失败时旧数据保留
+        with mock.patch("eastmoney.requests.get", side_effect=RuntimeError("network down")):
+            with self.assertRaises(RuntimeError):
+                eastmoney.sync_kline_raw("000001")
+        self.assertEqual(len(eastmoney.load_kline("000001", adjust="")), 1)
+
+        # 行情缺少涨跌额字段时仍写入起点因子，下次同步走增量而非再次全量重建
+        short = {"data": {"klines": ["2024-01-02,10.0,10.5,10.6,9.9,100,1000"]}}
+
+        class DummyResp:
+            def raise_for_status(self):
+                return None
+
+            def json(self):
+                return short
+
+        with mock.patch("eastmoney.requests.get", return_value=DummyResp()):
+            self.assertEqual(eastmoney.sync_kline_raw("000001"), 1)
+        self.assertAlmostEqual(eastmoney.load_kline("000001", adjust="qfq")["close"].iloc[0], 10.5)
+        with mock.patch("eastmoney.requests.get", return_value=DummyResp()) as get:
+            self.assertEqual(eastmoney.sync_kline_raw("000001"), 0)
+            self.assertEqual(get.call_args.kwargs["params"]["beg"], "20240102")
+
     def test_is_trading_time(self):
         # 周三上午 10:00
         dt = eastmoney.datetime(2024, 1, 3, 10, 0)
@@ -0,0 +1,102 @@
+import os
+import sys
+import threading
+import time
+import unittest
+from datetime import datetime
+
+import pandas as pd
+
+CURRENT_DIR = os.path.dirname(__file__)
+sys.path.insert(0, CURRENT_DIR)
+import history_cache  # noqa: E402
+from eastmoney import SH_TZ  # noqa: E402
+
+
+class HistoryCacheTestCase(unittest.TestCase):
+    """验证 LRU 淘汰、收盘过期与并发请求合并。"""
+
+    def setUp(self) -> None:
+        self.now = datetime(2024, 1, 3, 10, 0, tzinfo=SH_TZ)  # 周三上午
+        self.calls = []
+
+    def _fetch(self, symbol, adjust):
+        self.calls.append((symbol, adjust))
+        return pd.DataFrame({"close": [1.0] * 100})
+
+    def _cache(self, **kwargs):
+        return history_cache.HistoryCache(self._fetch, clock=lambda: self.now, **kwargs)
+
+    def test_next_close(self):
+        self.assertEqual(history_cache.next_close(self.now), datetime(2024, 1, 3, 15, 0, tzinfo=SH_TZ))
+        # 收盘后到次日收盘
+        after = datetime(2024, 1, 3, 16, 0, tzinfo=SH_TZ)
+        self.assertEqual(history_cache.next_close(after), datetime(2024, 1, 4, 15, 0, tzinfo=SH_TZ))
+        # 周五收盘后跳过周末
+        friday = datetime(2024, 1, 5, 15, 30, tzinfo=SH_TZ)
+        self.assertEqual(history_cache.next_close(friday), datetime(2024, 1, 8, 15, 0, tzinfo=SH_TZ))
+
+    def test_hit_and_expire_at_close(self):
+        cache = self._cache()
+        cache.get("600000")
+        cache.get("600000")
+        self.assertEqual(len(self.calls), 1)
+        self.now = datetime(2024, 1, 3, 15, 1, tzinfo=SH_TZ)
+        cache.get("600000")
+        self.assertEqual(len(self.calls), 2)
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["expirations"]), (1, 2, 1))
+
+    def test_lru_eviction_by_bytes(self):
+        size = int(self._fetch("x", "qfq").memory_usage(deep=True).sum())
+        self.calls.clear()
+        cache = self._cache(max_bytes=size * 2)
+        cache.get("A")
+        cache.get("B")
+        cache.get("A")  # A 变为最近使用
+        cache.get("C")  # 淘汰 B
+        cache.get("A")
+        cache.get("B")
+        self.assertEqual([c[0] for c in self.calls], ["A", "B", "C", "B"])
+        self.assertEqual(cache.stats()["evictions"], 2)
+        self.assertLessEqual(cache.stats()["bytes"], size * 2)
+
+    def test_concurrent_misses_coalesce(self):
+        gate = threading.Event()
+
+        def slow_fetch(symbol, adjust):
+            self.calls.append(symbol)
+            gate.wait(1)
+            return pd.DataFrame({"close": [1.0]})
+
+        cache = history_cache.HistoryCache(slow_fetch, clock=lambda: self.now)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get("600000"))) for _ in range(5)]
+        for t in threads:
+            t.start()
+        time.sleep(0.05)
+        gate.set()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(len(results), 5)
+        self.assertEqual(cache.stats()["coalesced"], 4)
+
+    def test_errors_and_empty_not_cached(self):
+        def failing(symbol, adjust):
+            self.calls.append(symbol)
+            raise ConnectionError("down")
+
+        cache = history_cache.HistoryCache(failing, clock=lambda: self.now)
+        for _ in range(2):
+            with self.assertRaises(ConnectionError):
+                cache.get("600000")
+        self.assertEqual(len(self.calls), 2)
+
+        empty = history_cache.HistoryCache(lambda s, a: pd.DataFrame(), clock=lambda: self.now)
+        empty.get("600000")
+        self.assertEqual(empty.stats()["entries"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
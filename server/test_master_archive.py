@@ -0,0 +1,107 @@
+import os
+import shutil
+import sys
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+CURRENT_DIR = os.path.dirname(__file__)
+sys.path.insert(0, CURRENT_DIR)
+import master_archive  # noqa: E402
+
+
+class MasterArchiveTestCase(unittest.TestCase):
+    """验证主表快照归档、代码字典编码与区间三维数组读取。"""
+
+    def setUp(self) -> None:
+        # 每个用例使用独立的临时归档目录
+        self.tmp_dir = os.path.join(CURRENT_DIR, "test_master_archive")
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        master_archive.ARCHIVE_DIR = self.tmp_dir
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def _snapshot(self, rows):
+        return pd.DataFrame(
+            [
+                {"code": code, "market_id": 1 if code.startswith("6") else 0, "name": name, "last": last, "pe_dynamic": pe}
+                for code, name, last, pe in rows
+            ]
+        )
+
+    def test_archive_and_load_day(self):
+        df = self._snapshot([("600519", "贵州茅台", 1700.0, 30.5), ("000001", "平安银行", 10.5, 6.5)])
+        path = master_archive.archive_master_snapshot(df, "20240102")
+        self.assertTrue(os.path.exists(path))
+
+        day = master_archive.load_master_day("20240102")
+        self.assertEqual(list(day["code"]), ["600519", "000001"])
+        self.assertEqual(day.loc[0, "name"], "贵州茅台")
+        self.assertEqual(day.loc[0, "market_id"], 1)
+        self.assertAlmostEqual(day.loc[1, "pe_dynamic"], 6.5)
+        # 源数据缺失的字段以 NaN 归档
+        self.assertTrue(np.isnan(day.loc[0, "total_mv"]))
+
+    def test_load_cube_across_days(self):
+        master_archive.archive_master_snapshot(
+            self._snapshot([("600519", "贵州茅台", 1700.0, 30.5), ("000001", "平安银行", 10.5, 6.5)]), "20240102"
+        )
+        # 次日新增一只股票，另一只停牌缺失
+        master_archive.archive_master_snapshot(
+            self._snapshot([("000001", "平安银行", 10.8, 6.6), ("300750", "宁德时代", 180.0, 25.0)]), "20240103"
+        )
+        master_archive.archive_master_snapshot(
+            self._snapshot([("000001", "平安银行", 11.0, 6.7)]), "20240110"
+        )
+        self.assertEqual(len(master_archive.load_code_dict()), 3)
+
+        dates, codes, cube = master_archive.load_master_cube("20240101", "20240105", fields=("last", "pe_dynamic"))
+        self.assertEqual(dates, ["20240102", "20240103"])
+        self.assertEqual(sorted(codes), ["000001", "300750", "600519"])
+        self.assertEqual(cube.shape, (2, 3, 2))
+        col = {c: i for i, c in enumerate(codes)}
+        self.assertAlmostEqual(cube[1, col["000001"], 0], 10.8)
+        self.assertAlmostEqual(cube[0, col["600519"], 1], 30.5)
+        self.assertTrue(np.isnan(cube[1, col["600519"], 0]))
+        self.assertTrue(np.isnan(cube[0, col["300750"], 0]))
+
+        out_path = os.path.join(self.tmp_dir, "cube.npy")
+        _, _, mm = master_archive.load_master_cube("20240101", "20240131", fields=("last",), out_path=out_path)
+        self.assertEqual(mm.shape, (3, 3, 1))
+        reloaded = np.load(out_path, mmap_mode="r")
+        self.assertAlmostEqual(reloaded[2, col["000001"], 0], 11.0)
+
+    def test_eod_archive_skips_intraday_and_holiday_duplicates(self):
+        df = self._snapshot([("600519", "贵州茅台", 1700.0, 30.5), ("000001", "平安银行", 10.5, 6.5)])
+        df["volume"], df["amount"] = [1000.0, 5000.0], [1.7e6, 5.2e4]
+        tz = master_archive.eastmoney.SH_TZ
+        with mock.patch.object(master_archive.eastmoney, "fetch_a_stock_list", return_value=df) as fetch:
+            # 周二盘中：拒绝归档且不拉取
+            self.assertIsNone(master_archive.run_eod_archive(now=datetime(2024, 1, 2, 14, 30, tzinfo=tz)))
+            fetch.assert_not_called()
+            path = master_archive.run_eod_archive(now=datetime(2024, 1, 2, 15, 5, tzinfo=tz))
+            self.assertTrue(path.endswith("20240102.npz"))
+            # 次日为休市日，接口仍返回上一交易日数据
+            self.assertIsNone(master_archive.run_eod_archive(now=datetime(2024, 1, 3, 15, 5, tzinfo=tz)))
+            # 补录：盘中拒绝，且只能补录最近一个已收盘交易日
+            df.loc[0, "last"] = 1710.0
+            self.assertIsNone(master_archive.run_eod_archive("20240104", now=datetime(2024, 1, 5, 10, 0, tzinfo=tz)))
+            self.assertIsNone(master_archive.run_eod_archive("20240103", now=datetime(2024, 1, 5, 8, 30, tzinfo=tz)))
+            self.assertEqual(fetch.call_count, 2)
+            path = master_archive.run_eod_archive("20240104", now=datetime(2024, 1, 5, 8, 30, tzinfo=tz))
+            self.assertTrue(path.endswith("20240104.npz"))
+            # 周一开盘前补录上周五
+            self.assertEqual(master_archive.last_completed_session(datetime(2024, 1, 8, 8, 30, tzinfo=tz)), "20240105")
+        self.assertEqual(master_archive.list_archived_dates(), ["20240102", "20240104"])
+
+    def test_unknown_field(self):
+        with self.assertRaises(ValueError):
+            master_archive.load_master_cube("20240101", "20240131", fields=("foo",))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,150 @@
+import os
+import sys
+import threading
+import time
+import unittest
+from unittest import mock
+import uuid
+
+import pandas as pd
+
+CURRENT_DIR = os.path.dirname(__file__)
+sys.path.insert(0, CURRENT_DIR)
+import quote_book  # noqa: E402
+
+
+class QuoteBookTestCase(unittest.TestCase):
+    """验证共享内存行情簿的写入、挂载读取与 seqlock 版本号。"""
+
+    def setUp(self) -> None:
+        # 每个用例使用独立的共享内存名称，避免并行运行互相干扰
+        self.name = f"qb_test_{uuid.uuid4().hex[:8]}"
+        self.writer = quote_book.QuoteBook.create(self.name, capacity=16)
+
+    def tearDown(self) -> None:
+        self.writer.close()
+
+    def _frame(self, last_000001: float = 12.0) -> pd.DataFrame:
+        return pd.DataFrame(
+            [
+                {"code": "000001", "name": "平安银行", "last": last_000001, "pre_close": 11.5, "high": 12.2,
+                 "low": 11.4, "open": 11.6, "volume": 1000, "amount": 12000.0},
+                {"code": "600000", "name": "浦发银行", "last": 10.0, "pre_close": 10.1, "high": 10.3,
+                 "low": 9.9, "open": 10.1, "volume": 500, "amount": 5000.0},
+            ]
+        )
+
+    def test_write_and_attach_read(self):
+        self.assertEqual(self.writer.write_frame(self._frame()), 2)
+        self.assertEqual(self.writer.seq % 2, 0)
+
+        reader = quote_book.QuoteBook.attach(self.name)
+        try:
+            quote = reader.get("000001")
+            self.assertEqual(quote["name"], "平安银行")
+            self.assertAlmostEqual(quote["last"], 12.0)
+            self.assertAlmostEqual(quote["amount"], 12000.0)
+            self.assertIsNone(reader.get("999999"))
+
+            # 写入方更新后，读取方无需重新挂载即可看到新值
+            self.writer.write_frame(self._frame(last_000001=12.5))
+            self.assertAlmostEqual(reader.get("000001")["last"], 12.5)
+            self.assertAlmostEqual(float(reader.view()["last"][0]), 12.5)
+
+            snap = reader.snapshot()
+            self.assertEqual(list(snap["code"]), ["000001", "600000"])
+            self.assertAlmostEqual(snap.loc[1, "pre_close"], 10.1)
+        finally:
+            reader.close()
+
+    def test_code_set_change_rebuilds_index(self):
+        self.writer.write_frame(self._frame())
+        reader = quote_book.QuoteBook.attach(self.name)
+        try:
+            self.assertIsNotNone(reader.get("600000"))
+            self.writer.write_quotes([{"code": "300750", "name": "宁德时代", "last": 180.0}])
+            self.assertIsNone(reader.get("600000"))
+            quote = reader.get("300750")
+            self.assertAlmostEqual(quote["last"], 180.0)
+            self.assertEqual(quote["amount"], 0.0)
+        finally:
+            reader.close()
+
+    def test_long_multibyte_name_truncated_on_char_boundary(self):
+        # 11 个汉字共 33 字节，按字节截断会切开最后一个字符
+        self.writer.write_quotes([{"code": "000002", "name": "万" * 11, "last": 8.0}])
+        reader = quote_book.QuoteBook.attach(self.name)
+        try:
+            self.assertEqual(reader.snapshot().loc[0, "name"], "万" * 10)
+            self.assertEqual(reader.get("000002")["name"], "万" * 10)
+        finally:
+            reader.close()
+
+    def test_stale_after_writer_restart(self):
+        self.writer.write_frame(self._frame())
+        reader = quote_book.QuoteBook.attach(self.name)
+        try:
+            self.assertFalse(reader.is_stale())
+            interval_ms = quote_book.DEFAULT_INTERVAL * 1000
+            self.assertTrue(reader.is_stale(now_ms=reader.updated_ms + int(interval_ms * quote_book.STALE_INTERVALS) + 1))
+
+            # 刷新进程重启：旧段打上关闭标记，新段代号不同
+            self.writer.close()
+            self.assertTrue(reader.is_stale())
+            self.writer = quote_book.QuoteBook.create(self.name, capacity=16)
+            fresh = quote_book.QuoteBook.attach(self.name)
+            try:
+                self.assertFalse(fresh.is_stale())
+                self.assertNotEqual(fresh.generation, reader.generation)
+            finally:
+                fresh.close()
+        finally:
+            reader.close()
+
+    def test_reader_waits_out_slow_writer(self):
+        self.writer.write_frame(self._frame())
+        reader = quote_book.QuoteBook.attach(self.name)
+        try:
+            # 模拟写入方在临界区内被抢占 20ms
+            self.writer._header[quote_book._H_SEQ] += 1
+            release = threading.Timer(0.02, lambda: self.writer._header.__setitem__(
+                quote_book._H_SEQ, self.writer._header[quote_book._H_SEQ] + 1))
+            release.start()
+            self.assertAlmostEqual(reader.get("000001")["last"], 12.0)
+            release.join()
+
+            self.writer._header[quote_book._H_SEQ] += 1
+            with mock.patch.object(quote_book, "READ_TIMEOUT", 0.01):
+                start = time.monotonic()
+                with self.assertRaises(TimeoutError):
+                    reader.get("000001")
+                self.assertLess(time.monotonic() - start, 0.5)
+            self.writer._header[quote_book._H_SEQ] += 1
+        finally:
+            reader.close()
+
+    def test_create_refuses_live_writer(self):
+        with self.assertRaises(FileExistsError):
+            quote_book.QuoteBook.create(self.name, capacity=16)
+        # 原写入方不受影响
+        self.assertEqual(self.writer.write_frame(self._frame()), 2)
+
+        # 写入方已关闭（或心跳超时）的残留段可以被接管
+        self.writer._header[quote_book._H_CLOSED] = 1
+        replacement = quote_book.QuoteBook.create(self.name, capacity=16)
+        self.writer._owner = False
+        self.writer.close()
+        self.writer = replacement
+        self.assertFalse(replacement.is_stale())
+
+    def test_reader_cannot_write(self):
+        reader = quote_book.QuoteBook.attach(self.name)
+        try:
+            with self.assertRaises(PermissionError):
+                reader.write_frame(self._frame())
+        finally:
+            reader.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
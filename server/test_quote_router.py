@@ -0,0 +1,125 @@
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+CURRENT_DIR = os.path.dirname(__file__)
+sys.path.insert(0, CURRENT_DIR)
+import quote_router  # noqa: E402
+
+
+def _source(last: float, delay: float = 0.0, fail: bool = False):
+    """构造测试用行情源：可设置延迟与失败。"""
+
+    def _fetch(codes):
+        time.sleep(delay)
+        if fail:
+            raise ConnectionError("upstream down")
+        return [{"code": c, "name": "x", "last": last, "pre_close": last - 1} for c in codes]
+
+    return _fetch
+
+
+class QuoteRouterTestCase(unittest.TestCase):
+    """验证对冲请求、故障转移与健康度统计。"""
+
+    def test_primary_answers_within_budget(self):
+        router = quote_router.QuoteRouter({"a": _source(1.0), "b": _source(2.0)}, hedge_max_delay=0.2)
+        rows = router.get_quotes(["000001"])
+        self.assertEqual(rows[0]["source"], "a")
+        self.assertEqual(rows[0]["amount"], 0.0)
+        self.assertAlmostEqual(rows[0]["pre_close"], 0.0)
+        self.assertEqual(router.health["b"].successes, 0)
+
+    def test_hedge_fires_when_primary_slow(self):
+        router = quote_router.QuoteRouter(
+            {"slow": _source(1.0, delay=0.5), "fast": _source(2.0)}, hedge_max_delay=0.05
+        )
+        start = time.monotonic()
+        rows = router.get_quotes(["000001", "600000"])
+        self.assertLess(time.monotonic() - start, 0.4)
+        self.assertEqual(rows[0]["source"], "fast")
+        self.assertEqual(len(rows), 2)
+
+    def test_failover_and_cooldown(self):
+        router = quote_router.QuoteRouter({"bad": _source(1.0, fail=True), "good": _source(2.0)})
+        for _ in range(quote_router.FAILURE_THRESHOLD):
+            self.assertEqual(router.get_quotes(["000001"])[0]["source"], "good")
+        self.assertFalse(router.health["bad"].healthy())
+        self.assertEqual(router.ranked_sources(), ["good", "bad"])
+        stats = {s["source"]: s for s in router.stats()}
+        self.assertEqual(stats["bad"]["consecutive_failures"], quote_router.FAILURE_THRESHOLD)
+        self.assertIn("upstream down", stats["bad"]["last_error"])
+
+    def test_all_sources_fail(self):
+        router = quote_router.QuoteRouter({"a": _source(1.0, fail=True), "b": _source(2.0, fail=True)})
+        with self.assertRaises(RuntimeError):
+            router.get_quotes(["000001"])
+
+    def test_rank_by_p95(self):
+        router = quote_router.QuoteRouter({"a": _source(1.0), "b": _source(2.0)})
+        for _ in range(quote_router.MIN_SAMPLES):
+            router.health["a"].record_success(0.3)
+            router.health["b"].record_success(0.1)
+        self.assertEqual(router.ranked_sources(), ["b", "a"])
+
+        # 无样本的新源排在有样本的健康源之后
+        router.health["c"] = quote_router.SourceHealth("c")
+        router.sources["c"] = _source(3.0)
+        self.assertEqual(router.ranked_sources(), ["b", "a", "c"])
+
+    def test_failures_count_as_latency(self):
+        health = quote_router.SourceHealth("flaky")
+        for _ in range(quote_router.MIN_SAMPLES):
+            health.record_success(0.05)
+        health.record_failure(ConnectionError("reset"))
+        self.assertGreater(health.p95(), 1.0)
+
+    def test_non_finite_values_and_unknown_codes(self):
+        item = quote_router.normalize_quote(
+            {"code": "000001", "name": float("nan"), "last": float("nan"), "high": float("inf")}, "x"
+        )
+        self.assertEqual((item["name"], item["last"], item["high"]), ("", 0.0, 0.0))
+
+        def _fetch(codes):
+            return [
+                {"code": "000001", "name": "平安银行", "last": 12.0, "volume": float("nan")},
+                {"code": "999999", "name": "", "last": 0.0},
+                {"code": "000002", "name": "万科A", "last": 0.0},
+            ]
+
+        rows = quote_router.QuoteRouter({"a": _fetch}).get_quotes(["000001", "999999", "000002"])
+        self.assertEqual([r["code"] for r in rows], ["000001"])
+        self.assertEqual(rows[0]["volume"], 0.0)
+
+    def test_source_without_valid_rows_fails_over(self):
+        def _empty(codes):
+            return [{"code": c, "name": "", "last": 0.0} for c in codes]
+
+        router = quote_router.QuoteRouter({"a": _empty, "b": _source(2.0)})
+        rows = router.get_quotes(["000001"])
+        self.assertEqual(rows[0]["source"], "b")
+        self.assertEqual(router.health["a"].failures, 1)
+        self.assertEqual((router.health["a"].successes, router.health["a"].wins), (0, 0))
+
+    def test_sources_agree_on_price_scale(self):
+        # 同一笔行情分别经东财直连（fltt=2）与 akshare 现货快照返回，统一后应完全一致
+        em_payload = {"data": {"f57": "000001", "f58": "平安银行", "f43": 12.34, "f60": 12.0, "f44": 12.5,
+                               "f45": 11.9, "f46": 12.1, "f47": 987654, "f48": 1.2e9}}
+        spot = pd.DataFrame([{"代码": "000001", "名称": "平安银行", "最新价": 12.34, "昨收": 12.0, "最高": 12.5,
+                              "最低": 11.9, "今开": 12.1, "成交量": 987654, "成交额": 1.2e9}])
+        resp = mock.Mock()
+        resp.json.return_value = em_payload
+        with mock.patch("eastmoney.requests.get", return_value=resp), \
+                mock.patch("akshare.stock_zh_a_spot_em", return_value=spot):
+            em = quote_router.normalize_quote(quote_router.eastmoney_source(["000001"])[0], "x")
+            ak = quote_router.normalize_quote(quote_router.akshare_source(["000001"])[0], "x")
+        self.assertEqual(em, ak)
+        self.assertAlmostEqual(em["last"], 12.34)
+
+
+if __name__ == "__main__":
+    unittest.main()
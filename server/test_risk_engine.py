@@ -0,0 +1,126 @@
+import os
+import sys
+import time
+import unittest
+
+import numpy as np
+import pandas as pd
+
+CURRENT_DIR = os.path.dirname(__file__)
+sys.path.insert(0, CURRENT_DIR)
+import eastmoney  # noqa: E402
+import risk_engine  # noqa: E402
+
+
+class RiskEngineTestCase(unittest.TestCase):
+    """验证增量统计与全量计算一致、复权后收益率读取以及 200 只股票的耗时。"""
+
+    def setUp(self) -> None:
+        self.tmp_db = os.path.join(CURRENT_DIR, "test_risk.db")
+        if os.path.exists(self.tmp_db):
+            os.remove(self.tmp_db)
+        eastmoney.DB_PATH = self.tmp_db
+        eastmoney.init_db()
+        self.rng = np.random.default_rng(7)
+
+    def tearDown(self) -> None:
+        if os.path.exists(self.tmp_db):
+            os.remove(self.tmp_db)
+
+    def test_incremental_matches_full_window(self):
+        rets = self.rng.normal(0, 0.02, size=(150, 8))
+        engine = risk_engine.RiskEngine([str(i) for i in range(8)], window=40)
+        engine.push_many(rets)
+        tail = rets[-40:]
+        np.testing.assert_allclose(engine.covariance(), np.cov(tail, rowvar=False), atol=1e-12)
+        np.testing.assert_allclose(engine.volatility(annualize=False), tail.std(axis=0, ddof=1), atol=1e-12)
+        market = tail.mean(axis=1)
+        beta = np.array([np.cov(tail[:, i], market, ddof=0)[0, 1] / market.var() for i in range(8)])
+        np.testing.assert_allclose(engine.beta(), beta, atol=1e-10)
+
+        cov, shrink = engine.shrunk_covariance()
+        self.assertTrue(0.0 <= shrink <= 1.0)
+        self.assertTrue(np.all(np.linalg.eigvalsh(cov) > 0))
+
+        var = engine.value_at_risk()
+        port = tail.mean(axis=1)
+        self.assertAlmostEqual(var["portfolio"]["var_hist"], -np.quantile(port, 0.05))
+        self.assertAlmostEqual(var["var_hist"][0], -np.quantile(tail[:, 0], 0.05))
+        self.assertGreater(var["portfolio"]["var_param"], 0)
+
+    def test_from_db_uses_adjusted_returns_and_refresh(self):
+        dates = pd.bdate_range("2024-01-01", periods=6).strftime("%Y-%m-%d").tolist()
+        # 000001 第 4 日 10 送 10：不复权价格腰斩，但复权收益应为 0
+        raw = {"000001": [10.0, 10.0, 10.0, 5.0, 5.0, 5.5], "600000": [8.0, 8.8, 8.8, 8.8, 8.8, 8.8]}
+        for code, closes in raw.items():
+            df = pd.DataFrame({"date": dates, "open": closes, "close": closes, "high": closes, "low": closes,
+                               "volume": 1, "amount": 1})
+            eastmoney.save_kline_to_db(code, df.iloc[:5])
+        eastmoney.save_adj_factors_to_db("000001", pd.DataFrame({"date": [dates[0], dates[3]], "factor": [1.0, 2.0]}))
+        eastmoney.save_adj_factors_to_db("600000", pd.DataFrame({"date": [dates[0]], "factor": [1.0]}))
+
+        engine = risk_engine.RiskEngine.from_db(["000001", "600000"], window=10)
+        self.assertEqual(engine.count, 4)
+        self.assertEqual(engine.last_date, dates[4])
+        x, _ = engine._valid()
+        np.testing.assert_allclose(x[:, 0], [0, 0, 0, 0], atol=1e-12)
+        self.assertAlmostEqual(x[0, 1], 0.1)
+
+        for code, closes in raw.items():
+            df = pd.DataFrame({"date": dates, "open": closes, "close": closes, "high": closes, "low": closes,
+                               "volume": 1, "amount": 1})
+            eastmoney.save_kline_to_db(code, df.iloc[5:])
+        self.assertEqual(engine.refresh(), 1)
+        self.assertEqual(engine.refresh(), 0)
+        x, _ = engine._valid()
+        self.assertAlmostEqual(x[4, 0], 0.1)
+
+    def test_first_load_reads_last_window_and_missing_benchmark_falls_back_once(self):
+        dates = pd.bdate_range("2024-01-01", periods=30).strftime("%Y-%m-%d").tolist()
+        closes = 10 * np.cumprod(1 + self.rng.normal(0, 0.02, size=(30, 2)), axis=0)
+        for j, code in enumerate(["000001", "600000"]):
+            df = pd.DataFrame({"date": dates, "open": closes[:, j], "close": closes[:, j], "high": closes[:, j],
+                               "low": closes[:, j], "volume": 1, "amount": 1})
+            eastmoney.save_kline_to_db(code, df.iloc[:29])
+
+        got_dates, _ = risk_engine.load_close_matrix(["000001", "600000"], last_n=6)
+        self.assertEqual(got_dates, dates[23:29])
+
+        engine = risk_engine.RiskEngine.from_db(["000001", "600000"], window=5, benchmark="000300")
+        self.assertEqual(engine.count, 5)
+        self.assertIsNone(engine.benchmark)
+        self.assertEqual(engine.summary()["benchmark"], "equal_weight")
+
+        # 基准后来有了数据也不在窗口中途切换
+        bench = pd.DataFrame({"date": dates, "open": 1.0, "close": 1.0, "high": 1.0, "low": 1.0, "volume": 1, "amount": 1})
+        eastmoney.save_kline_to_db("000300", bench)
+        eastmoney.save_kline_to_db("000001", pd.DataFrame({"date": [dates[29]], "open": [10.0], "close": [10.0],
+                                                           "high": [10.0], "low": [10.0], "volume": [1], "amount": [1]}))
+        self.assertEqual(engine.refresh(), 1)
+        self.assertEqual(engine.summary()["benchmark"], "equal_weight")
+        x, m = engine._valid()
+        np.testing.assert_allclose(m, x.mean(axis=1), atol=1e-12)
+
+    def test_index_benchmark(self):
+        dates = pd.bdate_range("2024-01-01", periods=8).strftime("%Y-%m-%d").tolist()
+        closes = 10 * np.cumprod(1 + self.rng.normal(0, 0.02, size=(8, 3)), axis=0)
+        for j, code in enumerate(["000300", "600000", "sh000300"]):
+            df = pd.DataFrame({"date": dates, "open": closes[:, j], "close": closes[:, j], "high": closes[:, j],
+                               "low": closes[:, j], "volume": 1, "amount": 1})
+            eastmoney.save_kline_to_db(code, df)
+        engine = risk_engine.RiskEngine.from_db(["000300", "600000"], window=10, benchmark="sh000300")
+        self.assertEqual(engine.summary()["benchmark"], "sh000300")
+        _, m = engine._valid()
+        np.testing.assert_allclose(m, closes[1:, 2] / closes[:-1, 2] - 1, atol=1e-12)
+
+    def test_universe_of_200_is_fast(self):
+        engine = risk_engine.RiskEngine([f"{i:06d}" for i in range(200)], window=60)
+        engine.push_many(self.rng.normal(0, 0.02, size=(60, 200)))
+        start = time.perf_counter()
+        engine.push(self.rng.normal(0, 0.02, size=200))
+        engine.summary(with_cov=True)
+        self.assertLess(time.perf_counter() - start, 0.2)
+
+
+if __name__ == "__main__":
+    unittest.main()
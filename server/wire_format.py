@@ -0,0 +1,108 @@
+"""
+Python 服务端点的响应格式协商与压缩。
+
+格式（?format= 优先，其次 Accept 头）：
+- rows（默认）：{"success": true, "data": [{...}, ...]}，与旧接口完全一致
+- columns：{"success": true, "format": "columns", "count": n, "data": {"field": [...], ...}}，
+  Accept: application/vnd.alphatrader.columns+json
+- msgpack：与 columns 同结构的 MessagePack 二进制，Accept: application/msgpack
+  （需安装可选依赖 msgpack，未安装时回退为 columns）
+
+压缩（Accept-Encoding）：优先 br（需安装可选依赖 brotli），其次 gzip；小于 MIN_COMPRESS_BYTES 不压缩。
+"""
+
+from __future__ import annotations
+
+import gzip
+import json
+from datetime import date, datetime
+from typing import Dict, List, Sequence
+
+from flask import Response, jsonify, request
+
+try:
+    import msgpack
+except ImportError:  # 可选依赖
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # 可选依赖
+    brotli = None
+
+COLUMNS_MIME = "application/vnd.alphatrader.columns+json"
+MSGPACK_MIME = "application/msgpack"
+FORMATS = ("rows", "columns", "msgpack")
+# 小响应压缩收益有限，直接返回
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def negotiate_format() -> str:
+    """根据 ?format= 与 Accept 头确定响应格式。"""
+    fmt = request.args.get("format", "").lower()
+    if not fmt:
+        accept = request.headers.get("Accept", "")
+        if MSGPACK_MIME in accept or "application/x-msgpack" in accept:
+            fmt = "msgpack"
+        elif COLUMNS_MIME in accept:
+            fmt = "columns"
+        else:
+            fmt = "rows"
+    if fmt not in FORMATS:
+        fmt = "rows"
+    if fmt == "msgpack" and msgpack is None:
+        fmt = "columns"
+    return fmt
+
+
+def columns_to_rows(columns: Dict[str, Sequence]) -> List[Dict]:
+    """列式数据转换为逐行字典列表。"""
+    keys = list(columns)
+    return [dict(zip(keys, values)) for values in zip(*(columns[k] for k in keys))]
+
+
+def rows_to_columns(rows: Sequence[Dict], keys: Sequence[str]) -> Dict[str, List]:
+    """逐行字典列表转换为列式数据，keys 决定列顺序。"""
+    return {k: [row.get(k) for row in rows] for k in keys}
+
+
+def _msgpack_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"cannot serialize {type(value).__name__}")
+
+
+def _compress(resp: Response) -> Response:
+    """按 Accept-Encoding 压缩响应体。"""
+    body = resp.get_data()
+    if len(body) < MIN_COMPRESS_BYTES:
+        return resp
+    accept = request.headers.get("Accept-Encoding", "")
+    if brotli is not None and "br" in accept:
+        resp.set_data(brotli.compress(body, quality=BROTLI_QUALITY))
+        resp.headers["Content-Encoding"] = "br"
+    elif "gzip" in accept:
+        resp.set_data(gzip.compress(body, compresslevel=GZIP_LEVEL))
+        resp.headers["Content-Encoding"] = "gzip"
+    return resp
+
+
+def respond(columns: Dict[str, Sequence]) -> Response:
+    """以协商后的格式与压缩方式返回成功响应，columns 为 字段 -> 值列表。"""
+    fmt = negotiate_format()
+    if fmt == "rows":
+        resp = jsonify({"success": True, "data": columns_to_rows(columns)})
+    else:
+        count = len(next(iter(columns.values()))) if columns else 0
+        payload = {"success": True, "format": "columns", "count": count, "data": columns}
+        if fmt == "msgpack":
+            body = msgpack.packb(payload, default=_msgpack_default, use_bin_type=True)
+            resp = Response(body, mimetype=MSGPACK_MIME)
+        else:
+            body = json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=str)
+            resp = Response(body, content_type=f"{COLUMNS_MIME}; charset=utf-8")
+    # 响应内容随 Accept 与 Accept-Encoding 变化，无论是否压缩都需告知缓存
+    resp.headers["Vary"] = "Accept, Accept-Encoding"
+    return _compress(resp)